@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+'''
+# Python script: general/abqdocstore.py
+# ---------------------------------------
+# Module with a local SQLite store of the documentation data, so that
+# you can compare releases, e.g. "when did the Ent Viewer get a privilege"
+#
+# The scripts save their data for a release version, e.g. v463:
+# - process_properties_table.py: properties
+# - api_process_abiquo_privileges_ui_order.py: privileges and role grants
+# - process_api_error_from_api_python3.py: API errors
+# - process_events_table.py: tracer events
+# - process_config_view.py: Configuration view settings
+#
+# Each script replaces the data for its release in one transaction
+#
+# Query the store from the general folder, for example:
+#   python3 abqdocstore.py releases
+#   python3 abqdocstore.py grant VAPP_CUSTOMISE_SETTINGS EV
+#   python3 abqdocstore.py property abiquo.vsm.pollfrequency
+#   python3 abqdocstore.py error VM-1
+#   python3 abqdocstore.py event VIRTUAL_MACHINE
+#   python3 abqdocstore.py setting client.wiki.vm.createVirtualMachine
+#   python3 abqdocstore.py sql "select count(*) from properties"
+'''
+
+import re
+import sqlite3
+import sys
+import time
+
+DOC_STORE_FILE = "output_files/abiquo_doc_store.sqlite"
+
+DOC_STORE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS releases (
+    release TEXT PRIMARY KEY,
+    saved REAL);
+CREATE TABLE IF NOT EXISTS properties (
+    release TEXT, name TEXT, category TEXT, profiles TEXT,
+    default_value TEXT, plugin_defaults TEXT, description TEXT,
+    valid_values TEXT);
+CREATE INDEX IF NOT EXISTS properties_release ON properties (release);
+CREATE INDEX IF NOT EXISTS properties_name ON properties (name);
+CREATE TABLE IF NOT EXISTS privileges (
+    release TEXT, privilege TEXT, gui_label TEXT, category TEXT,
+    description TEXT);
+CREATE INDEX IF NOT EXISTS privileges_release ON privileges (release);
+CREATE INDEX IF NOT EXISTS privileges_privilege ON privileges (privilege);
+CREATE TABLE IF NOT EXISTS role_grants (
+    release TEXT, privilege TEXT, role TEXT, role_initials TEXT);
+CREATE INDEX IF NOT EXISTS role_grants_release ON role_grants (release);
+CREATE INDEX IF NOT EXISTS role_grants_privilege
+    ON role_grants (privilege, role);
+CREATE TABLE IF NOT EXISTS api_errors (
+    release TEXT, section TEXT, error_id TEXT, message TEXT, label TEXT);
+CREATE INDEX IF NOT EXISTS api_errors_release ON api_errors (release);
+CREATE INDEX IF NOT EXISTS api_errors_error_id ON api_errors (error_id);
+CREATE TABLE IF NOT EXISTS tracer_events (
+    release TEXT, entity TEXT, action TEXT, severity TEXT, message TEXT,
+    privileges TEXT);
+CREATE INDEX IF NOT EXISTS tracer_events_release ON tracer_events (release);
+CREATE INDEX IF NOT EXISTS tracer_events_entity
+    ON tracer_events (entity, action);
+CREATE TABLE IF NOT EXISTS config_settings (
+    release TEXT, label TEXT, setting TEXT, default_value TEXT, info TEXT);
+CREATE INDEX IF NOT EXISTS config_settings_release
+    ON config_settings (release);
+CREATE INDEX IF NOT EXISTS config_settings_setting
+    ON config_settings (setting);
+'''
+
+# Columns of each table after the release
+DOC_STORE_COLUMNS = {
+    "properties": ["name", "category", "profiles", "default_value",
+                   "plugin_defaults", "description", "valid_values"],
+    "privileges": ["privilege", "gui_label", "category", "description"],
+    "role_grants": ["privilege", "role", "role_initials"],
+    "api_errors": ["section", "error_id", "message", "label"],
+    "tracer_events": ["entity", "action", "severity", "message",
+                      "privileges"],
+    "config_settings": ["label", "setting", "default_value", "info"]}
+
+
+def open_doc_store(store_path=DOC_STORE_FILE):
+    '''Open the doc store and create the tables if they don't exist'''
+    connection = sqlite3.connect(store_path)
+    connection.executescript(DOC_STORE_SCHEMA)
+    return connection
+
+
+def save_release_rows(release, table_rows, store_path=DOC_STORE_FILE):
+    '''Replace the rows of the tables for a release in one transaction.
+    # table_rows is a dict of table name and list of row tuples'''
+    connection = open_doc_store(store_path)
+    with connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO releases VALUES (?, ?)",
+            (release, time.time()))
+        for table, rows in table_rows.items():
+            columns = ["release"] + DOC_STORE_COLUMNS[table]
+            connection.execute("DELETE FROM " + table + " WHERE release = ?",
+                               (release,))
+            connection.executemany(
+                "INSERT INTO " + table + " (" + ", ".join(columns)
+                + ") VALUES (" + ", ".join("?" * len(columns)) + ")",
+                ((release,) + tuple(row) for row in rows))
+    connection.close()
+    print("Saved release ", release, " in the doc store: ",
+          ", ".join(table + " " + str(len(rows))
+                    for table, rows in table_rows.items()))
+
+
+def release_key(release):
+    '''Sort releases as versions, e.g. v463 before v5100 and 4.6.3'''
+    return [int(part) if part.isdigit() else part
+            for part in re.findall(r"\d+|[^\d.]+", release.lower())]
+
+
+def query_doc_store(query, parameters=(), store_path=DOC_STORE_FILE):
+    '''Run a query on the doc store and return the rows'''
+    connection = open_doc_store(store_path)
+    rows = connection.execute(query, parameters).fetchall()
+    connection.close()
+    return rows
+
+
+def print_by_release(rows):
+    '''Print rows that start with the release, in release order'''
+    for row in sorted(rows, key=lambda row: release_key(row[0])):
+        print(" | ".join(str(value) for value in row))
+
+
+def query_grant(privilege, role):
+    '''Print the releases where a role has a privilege and the first one.
+    # The role can be a key, e.g. ENTERPRISE_VIEWER, or initials, e.g. EV'''
+    rows = query_doc_store(
+        "SELECT release, privilege, role FROM role_grants "
+        "WHERE privilege = ? AND (role = ? OR role_initials = ?)",
+        (privilege, role, role))
+    print_by_release(rows)
+    if rows:
+        first_release = min(rows, key=lambda row: release_key(row[0]))[0]
+        print("First release with the privilege: ", first_release)
+    else:
+        print("The role doesn't have the privilege in any release")
+
+
+# Query commands with the query and the number of parameters
+DOC_STORE_QUERIES = {
+    "releases": ("SELECT release, datetime(saved, 'unixepoch') "
+                 "FROM releases", 0),
+    "property": ("SELECT release, name, default_value, plugin_defaults, "
+                 "profiles, valid_values FROM properties WHERE name = ?", 1),
+    "error": ("SELECT release, error_id, message, label FROM api_errors "
+              "WHERE error_id = ?", 1),
+    "event": ("SELECT release, entity, action, severity, message, privileges "
+              "FROM tracer_events WHERE entity = ?", 1),
+    "setting": ("SELECT release, label, setting, default_value, info "
+                "FROM config_settings WHERE setting = ?", 1)}
+
+
+def main():
+    '''Query the doc store'''
+    args = sys.argv[1:]
+    start = time.perf_counter()
+    if args[:1] == ["grant"] and len(args) == 3:
+        query_grant(args[1], args[2])
+    elif args[:1] == ["sql"] and len(args) == 2:
+        for row in query_doc_store(args[1]):
+            print(" | ".join(str(value) for value in row))
+    elif args[:1] and args[0] in DOC_STORE_QUERIES \
+            and len(args) == DOC_STORE_QUERIES[args[0]][1] + 1:
+        print_by_release(query_doc_store(DOC_STORE_QUERIES[args[0]][0],
+                                         args[1:]))
+    else:
+        print("Usage: python3 abqdocstore.py releases")
+        print("       python3 abqdocstore.py grant PRIVILEGE ROLE")
+        print("       python3 abqdocstore.py property|error|event|setting KEY")
+        print("       python3 abqdocstore.py sql QUERY")
+        sys.exit()
+    print("Query time: %.1f ms" % ((time.perf_counter() - start) * 1000))
+
+
+# Calls the main() function
+if __name__ == '__main__':
+    main()
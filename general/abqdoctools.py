@@ -14,13 +14,25 @@
 # 4. Get parent page ID
 # 5. Hide a page
 # 6. Update the wiki
+# 7. Convert wiki markup to storage format
+#
+# To check the conversion against Confluence, run a publishing script with
+# --check-conversion, e.g. python3 process_events_table.py --check-conversion
+# To record the Confluence conversion of the fixture in input_files,
+# and to check the conversion of the fixture against that recording:
+#   python3 abqdoctools.py --record-fixture
+#   python3 abqdoctools.py --check-fixture
 '''
 
+import difflib
+import html
 import json
+import os
 import re
 import sys
 import requests
 from atlassian import Confluence
+import abqhttpfixtures as ahf
 
 # Note may use these in the future if proper checks logging etc
 # def getPgFull(confluence, initial_page):
@@ -69,6 +81,377 @@ def get_parent_page_id(page):
     return parent_page_id
 
 
+# Option of the publishing scripts to compare with the Confluence conversion
+CHECK_CONVERSION_OPTION = "--check-conversion"
+CHECK_FIXTURE_OPTION = "--check-fixture"
+RECORD_FIXTURE_OPTION = "--record-fixture"
+CONVERSION_FIXTURE_WIKI = "input_files/conversion_fixture_wiki.txt"
+# Confluence conversion of the fixture, recorded with abqhttpfixtures.py
+CONVERSION_FIXTURE_ARCHIVE = "input_files/conversion_fixture.json.gz"
+CONVERT_TO_STORAGE_PATH = "/rest/api/contentbody/convert/storage"
+
+# Wiki markup emoticons and their storage format names
+EMOTICONS = {"(i)": "information", "(!)": "warning", "(-)": "minus",
+             "(+)": "plus", "(x)": "cross", "(/)": "tick",
+             "(?)": "question", "(*)": "yellow-star",
+             "(on)": "light-on", "(off)": "light-off"}
+
+# Text effects and their storage format tags
+TEXT_EFFECTS = {"*": ("<strong>", "</strong>"),
+                "_": ("<em>", "</em>"),
+                "-": ('<span style="text-decoration: line-through;">',
+                      "</span>"),
+                "^": ("<sup>", "</sup>"),
+                "~": ("<sub>", "</sub>")}
+
+# Text effects that can start or end in a word
+WORD_EFFECTS = "^~"
+
+# Macros with a body, which is text as it is, e.g. {code}...{code}
+BODY_MACROS = ["code", "noformat", "newcode"]
+# Macros with only parameters, e.g. {status:colour=Green|title=API}
+PARAMETER_MACROS = ["status", "anchor"]
+BODY_MACRO = re.compile(r"^\{(\w+)(?::([^{}]*))?\}(.*)\{\1\}$", re.DOTALL)
+
+# Inline wiki markup in the order to match it
+WIKI_TOKENS = re.compile(r"""
+    (?P<body_macro>\{(?P<body_name>code|noformat|newcode)(?::[^{}]*)?\}
+        .*?\{(?P=body_name)\})                   # text as it is
+  | (?P<linebreak>\\\\)                         # \\ line break
+  | \\(?P<escaped>.)                            # escaped character
+  | (?P<header_cell>\|\|)                       # header cell separator
+  | (?P<cell>\|)                                # cell separator
+  | \{\{(?P<monospace>.+?)\}\}                   # {{monospace}}
+  | \{(?P<macro>[a-zA-Z][\w-]*(?::[^{}]*)?)\}    # macro or {literal} text
+  | \[(?P<link>(?:[^\[\]\\]|\\.)+)\]            # [text|target] link
+  | (?P<emoticon>\((?:i|!|-|\+|x|/|\?|\*|on|off)\))
+  | (?P<effect>[-*_^~])                         # bold, italic, strike, etc.
+  | (?P<text>[^\\|{\[(*_^~-]+|.)
+""", re.VERBOSE)
+
+# List item, e.g. "* item" or "#* item in a bullet list in a numbered list"
+WIKI_LIST_ITEM = re.compile(r"^([*#]+)\s+(.*)$")
+LIST_TAGS = {"*": "ul", "#": "ol"}
+
+WIKI_HEADING = re.compile(r"^h([1-6])\.\s+(.*)$", re.DOTALL)
+
+
+def escape_storage_text(text):
+    '''Escape text for storage format, but keep entities such as &#123;'''
+    text = re.sub(r"&(?!#?\w+;)", "&amp;", text)
+    return text.replace("<", "&lt;").replace(">", "&gt;")
+
+
+def get_cdata(text):
+    '''Get text as a CDATA section'''
+    return "<![CDATA[" + text.replace("]]>", "]]]]><![CDATA[>") + "]]>"
+
+
+def get_macro_parameters(name, parameters):
+    '''Convert the parameters of a macro, e.g. colour=green|title=API'''
+    storage_parameters = ""
+    for parameter in parameters.split("|"):
+        if not parameter.strip():
+            continue
+        key, _, value = parameter.rpartition("=")
+        value = value.strip()
+        if name == "status" and key == "colour":
+            value = value.capitalize()
+        storage_parameters += '<ac:parameter ac:name="' + key.strip() + '">' \
+            + escape_storage_text(value) + '</ac:parameter>'
+    return storage_parameters
+
+
+def convert_macro(name, parameters):
+    '''Convert a macro without a body, e.g. {status:colour=green|title=API}'''
+    return '<ac:structured-macro ac:name="' + name + '">' \
+        + get_macro_parameters(name, parameters) + '</ac:structured-macro>'
+
+
+def convert_body_macro(macro_text):
+    '''Convert a macro with a plain text body, e.g. {code}...{code}'''
+    name, parameters, body = BODY_MACRO.match(macro_text).groups()
+    return '<ac:structured-macro ac:name="' + name + '">' \
+        + get_macro_parameters(name, parameters or "") \
+        + "<ac:plain-text-body>" + get_cdata(body) \
+        + "</ac:plain-text-body></ac:structured-macro>"
+
+
+def convert_link(link):
+    '''Convert a link, e.g. [text|https://...], [Page#anchor] or [#anchor]'''
+    link = re.sub(r"\\(.)", r"\1", link)
+    text, _, target = link.rpartition("|")
+    target = target.strip()
+    if re.match(r"^(https?|ftp|file|mailto):", target):
+        return '<a href="' + html.escape(target) + '">' \
+            + escape_storage_text(text or target) + '</a>'
+    page_title, _, anchor = target.partition("#")
+    storage_link = "<ac:link"
+    if anchor:
+        storage_link += ' ac:anchor="' + html.escape(anchor) + '"'
+    storage_link += ">"
+    if page_title:
+        storage_link += '<ri:page ri:content-title="' \
+            + html.escape(page_title) + '" />'
+    if text:
+        storage_link += "<ac:plain-text-link-body>" + get_cdata(text) \
+            + "</ac:plain-text-link-body>"
+    return storage_link + "</ac:link>"
+
+
+def is_effect_boundary(line, position, effect):
+    '''Check if the character at the position is not part of a word.
+    # Superscript and subscript can be in a word, e.g. x^2^ or H~2~O'''
+    return effect in WORD_EFFECTS or position < 0 or position >= len(line) \
+        or not (line[position].isalnum() or line[position] in TEXT_EFFECTS)
+
+
+def convert_wiki_line(line):
+    '''Convert a line of wiki markup to a list of cells.
+    # Each cell is (tag, storage format), where tag is th, td,
+    # or None for a line that is not a table row'''
+    cells = []
+    tag = None
+    pieces = []
+    # Open text effects and colors, with their position in pieces
+    open_effects = []
+    open_colors = 0
+
+    def close_cell():
+        '''Add the cell and make unclosed text effects plain text'''
+        for (effect, position) in open_effects:
+            pieces[position] = escape_storage_text(effect)
+        cell = "".join(pieces) + "</span>" * open_colors
+        heading = WIKI_HEADING.match(cell.strip())
+        if heading:
+            cell = "<h" + heading.group(1) + ">" + heading.group(2) \
+                + "</h" + heading.group(1) + ">"
+        cells.append((tag, cell.strip()))
+
+    for token in WIKI_TOKENS.finditer(line):
+        kind = token.lastgroup
+        if kind in ("header_cell", "cell"):
+            if tag is not None or pieces:
+                close_cell()
+            tag = "th" if kind == "header_cell" else "td"
+            pieces = []
+            open_effects = []
+            open_colors = 0
+        elif kind == "body_macro":
+            pieces.append(convert_body_macro(token.group("body_macro")))
+        elif kind == "linebreak":
+            pieces.append("<br />")
+        elif kind == "escaped":
+            pieces.append(escape_storage_text(token.group("escaped")))
+        elif kind == "monospace":
+            pieces.append("<code>" + escape_storage_text(
+                token.group("monospace")) + "</code>")
+        elif kind == "macro":
+            macro, _, parameters = token.group("macro").partition(":")
+            if macro in BODY_MACROS:
+                raise ValueError("Cannot convert a " + macro
+                                 + " macro without an end on the line: "
+                                 + line)
+            if macro in PARAMETER_MACROS:
+                pieces.append(convert_macro(macro, parameters))
+            elif macro != "color":
+                # Not a macro that the scripts use, e.g. {plugin}
+                pieces.append(escape_storage_text(token.group(0)))
+            elif parameters:
+                pieces.append('<span style="color: '
+                              + html.escape(parameters.strip()) + ';">')
+                open_colors += 1
+            elif open_colors:
+                pieces.append("</span>")
+                open_colors -= 1
+        elif kind == "link":
+            pieces.append(convert_link(token.group("link")))
+        elif kind == "emoticon":
+            pieces.append('<ac:emoticon ac:name="'
+                          + EMOTICONS[token.group("emoticon")] + '" />')
+        elif kind == "effect":
+            effect = token.group("effect")
+            start, end = token.start(), token.end()
+            if open_effects and open_effects[-1][0] == effect \
+                    and not line[start - 1].isspace() \
+                    and is_effect_boundary(line, end, effect):
+                open_effects.pop()
+                pieces.append(TEXT_EFFECTS[effect][1])
+            elif is_effect_boundary(line, start - 1, effect) \
+                    and end < len(line) \
+                    and not (line[end].isspace()
+                             or line[end] in TEXT_EFFECTS):
+                open_effects.append((effect, len(pieces)))
+                pieces.append(TEXT_EFFECTS[effect][0])
+            else:
+                pieces.append(effect)
+        else:
+            pieces.append(escape_storage_text(token.group("text")))
+    # The separator at the end of a row doesn't start another cell
+    if tag is None or "".join(pieces).strip():
+        close_cell()
+    return cells
+
+
+def change_list_level(list_stack, markers):
+    '''Get the storage format to go from the open lists to the lists of the
+    # markers of an item, e.g. "#*", and update the open lists.
+    # With no markers, close all the lists'''
+    list_tags = [LIST_TAGS[marker] for marker in markers]
+    common = 0
+    while common < min(len(list_stack), len(list_tags)) \
+            and list_stack[common] == list_tags[common]:
+        common += 1
+    storage_format = ""
+    while len(list_stack) > common:
+        storage_format += "</li></" + list_stack.pop() + ">"
+    if list_tags and len(list_stack) == len(list_tags):
+        storage_format += "</li><li>"
+    for list_tag in list_tags[common:]:
+        storage_format += "<" + list_tag + "><li>"
+        list_stack.append(list_tag)
+    return storage_format
+
+
+def iter_wiki_to_storage(wiki_lines):
+    '''Convert the lines of the wiki markup that the scripts create
+    # to storage format, and yield the storage format in parts'''
+    in_table = False
+    paragraph = []
+    list_stack = []
+    for line in wiki_lines:
+        line = line.rstrip("\r\n")
+        is_row = line.lstrip().startswith("|")
+        list_item = WIKI_LIST_ITEM.match(line.strip())
+        if paragraph and (is_row or list_item or not line.strip()):
+            yield "<p>" + "<br />".join(paragraph) + "</p>\n"
+            paragraph = []
+        if in_table and not is_row:
+            yield "</tbody></table>\n"
+            in_table = False
+        if list_stack and not list_item:
+            yield change_list_level(list_stack, "") + "\n"
+        if list_item:
+            yield change_list_level(list_stack, list_item.group(1))
+            yield convert_wiki_line(list_item.group(2))[0][1]
+            continue
+        if not line.strip():
+            continue
+        cells = convert_wiki_line(line.strip())
+        if is_row:
+            if not in_table:
+                yield "<table><tbody>\n"
+                in_table = True
+            yield "<tr>" + "".join("<" + tag + ">" + cell + "</" + tag + ">"
+                                   for (tag, cell) in cells) + "</tr>\n"
+        elif re.match(r"^<h[1-6]>", cells[0][1]):
+            yield cells[0][1] + "\n"
+        else:
+            paragraph.append(cells[0][1])
+    if paragraph:
+        yield "<p>" + "<br />".join(paragraph) + "</p>\n"
+    if in_table:
+        yield "</tbody></table>\n"
+    if list_stack:
+        yield change_list_level(list_stack, "") + "\n"
+
+
+def convert_wiki_to_storage(wiki_content):
+    '''Convert wiki markup to storage format, without the Confluence API'''
+    return "".join(iter_wiki_to_storage(wiki_content.splitlines()))
+
+
+def get_storage_lines(storage_content):
+    '''Split storage format into a line for each table row or block
+    # to compare it, ignoring the spaces between tags'''
+    storage_content = re.sub(r">\s+<", "><", storage_content.strip())
+    return re.sub(r"(<(?:tr|table|/table|p|h[1-6])[ >])", r"\n\1",
+                  storage_content).strip().split("\n")
+
+
+def diff_storage(expected_content, storage_content, expected_name, name):
+    '''Get the lines of a diff between two storage format conversions'''
+    return list(difflib.unified_diff(get_storage_lines(expected_content),
+                                     get_storage_lines(storage_content),
+                                     expected_name, name, lineterm=""))
+
+
+def check_conversion(confluence, wiki_content, page_content, page_title):
+    '''Convert the wiki markup with Confluence too and compare.
+    # Save the differences and use the Confluence conversion if they differ'''
+    remote_content = confluence.convert_wiki_to_storage(wiki_content)["value"]
+    conversion_diff = diff_storage(remote_content, page_content,
+                                   "confluence", "abqdoctools")
+    if not conversion_diff:
+        print("Conversion of ", page_title, " is the same as Confluence")
+        return page_content
+    diff_file = "./output_files/conversion_check_" \
+        + re.sub(r"\W+", "_", page_title) + ".diff"
+    with open(diff_file, "w") as f:
+        f.write("\n".join(conversion_diff) + "\n")
+    print("Conversion of ", page_title, " is not the same as Confluence, "
+          "using the Confluence conversion. See: ", diff_file)
+    return remote_content
+
+
+def read_conversion_fixture():
+    '''Get the wiki markup of the conversion fixture'''
+    with open(CONVERSION_FIXTURE_WIKI, "r") as f:
+        return f.read()
+
+
+def record_conversion_fixture():
+    '''Record the Confluence conversion of the fixture in the archive'''
+    site_url = input("Confluence Cloud site URL, with protocol,"
+                     + " and wiki, and exclude final slash, "
+                     + "e.g. https://abiquo.atlassian.net/wiki: ")
+    cloud_username = input("Cloud username: ")
+    pwd = input("Cloud token string: ")
+    ahf.setup_http_fixtures("record", CONVERSION_FIXTURE_ARCHIVE)
+    confluence = Confluence(
+        url=site_url,
+        username=cloud_username,
+        password=pwd,
+        cloud=True)
+    confluence.convert_wiki_to_storage(read_conversion_fixture())
+
+
+def check_conversion_fixture():
+    '''Compare the conversion of the fixture with the recorded
+    # Confluence conversion, which is replayed from the archive'''
+    record_message = "Record the Confluence conversion of the fixture " \
+        "with: python3 abqdoctools.py " + RECORD_FIXTURE_OPTION
+    if not os.path.exists(CONVERSION_FIXTURE_ARCHIVE):
+        sys.exit(record_message)
+    ahf.setup_http_fixtures("replay", CONVERSION_FIXTURE_ARCHIVE)
+    site_urls = [request_key.split(" ")[1].split(CONVERT_TO_STORAGE_PATH)[0]
+                 for request_key in ahf.http_fixtures
+                 if CONVERT_TO_STORAGE_PATH in request_key]
+    if not site_urls:
+        sys.exit(record_message)
+    confluence = Confluence(
+        url=site_urls[0],
+        username="replay",
+        password="replay",
+        cloud=True)
+    wiki_content = read_conversion_fixture()
+    try:
+        remote_content = \
+            confluence.convert_wiki_to_storage(wiki_content)["value"]
+    except requests.ConnectionError:
+        sys.exit("The fixture has changed since it was recorded. "
+                 + record_message)
+    conversion_diff = diff_storage(remote_content,
+                                   convert_wiki_to_storage(wiki_content),
+                                   "confluence", "abqdoctools")
+    for diff_line in conversion_diff:
+        print(diff_line)
+    if conversion_diff:
+        print("The conversion of the fixture is not the same as Confluence")
+        sys.exit(1)
+    print("The conversion of the fixture is the same as Confluence")
+
+
 def updateWiki(update_page_title, wiki_content, wiki_format, site_url,
                cloud_username, pwd, spacekey,
                release_version, print_version, operation):
@@ -107,8 +490,10 @@ def updateWiki(update_page_title, wiki_content, wiki_format, site_url,
     # print("end orig_page_content ------\n")
     # Convert events table to Confluence XHTML format from wiki style
     if wiki_format is True:
-        page_content_dict = confluence.convert_wiki_to_storage(wiki_content)
-        page_content = page_content_dict["value"][:]
+        page_content = convert_wiki_to_storage(wiki_content)
+        if CHECK_CONVERSION_OPTION in sys.argv[1:]:
+            page_content = check_conversion(confluence, wiki_content,
+                                            page_content, update_page_title)
         with open("./output_files/pageouttest.txt", "w") as f:
             f.write(page_content)
     else:
@@ -175,6 +560,12 @@ def updateWiki(update_page_title, wiki_content, wiki_format, site_url,
 
 def main():
     '''Documentation tools module for Abiquo wiki scripts'''
+    if CHECK_FIXTURE_OPTION in sys.argv[1:]:
+        check_conversion_fixture()
+        return
+    if RECORD_FIXTURE_OPTION in sys.argv[1:]:
+        record_conversion_fixture()
+        return
     # Print something to let user know what is going on
     print("This module has tools to do the documentation release\n")
     print("These common tools are used in scripts\n")
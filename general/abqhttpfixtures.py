@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+'''
+# Python script: general/abqhttpfixtures.py
+# ---------------------------------------
+# Module to record the HTTP responses of a script and replay them offline
+# - Works for do_api_request, the Abiquo client and Confluence, because
+#   they all send requests with the requests HTTPAdapter
+# - Saves the responses in a compressed fixture archive
+# - Matches requests by method, URL, Accept and Content-Type headers
+#   and body. The Authorization header is never saved
+#
+# Set the mode and archive with environment variables, for example:
+#   ABQ_HTTP_MODE=record python3 process_config_view.py
+#   ABQ_HTTP_MODE=replay python3 process_config_view.py
+# To use another archive than input_files/http_fixtures.json.gz:
+#   ABQ_HTTP_ARCHIVE=input_files/config_view_v463.json.gz
+'''
+
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import os
+import sys
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+HTTP_FIXTURES_FILE = "input_files/http_fixtures.json.gz"
+
+# Headers that select a different response from the API
+MATCH_HEADERS = ["Accept", "Content-Type"]
+# Response headers with credentials that are not saved
+SECRET_HEADERS = ["set-cookie"]
+
+# Responses by request key, in the order they were received
+http_fixtures = {}
+# Number of responses already replayed for each request key
+replayed_responses = {}
+send_without_fixtures = HTTPAdapter.send
+
+
+def get_request_key(request):
+    '''Get the key to match a request with its response'''
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return " ".join([request.method, request.url]
+                    + [header + "=" + request.headers.get(header, "")
+                       for header in MATCH_HEADERS]
+                    + [hashlib.sha256(body).hexdigest()])
+
+
+def load_http_fixtures(archive_path):
+    '''Load the responses from the fixture archive'''
+    with gzip.open(archive_path, "rt", encoding="utf-8") as archive_file:
+        return json.load(archive_file)
+
+
+def save_http_fixtures(archive_path):
+    '''Save the recorded responses in the fixture archive'''
+    with gzip.open(archive_path, "wt", encoding="utf-8") as archive_file:
+        json.dump(http_fixtures, archive_file, sort_keys=True)
+    print("Saved HTTP responses in: ", archive_path)
+
+
+def record_send(adapter, request, *args, **kwargs):
+    '''Send the request and record the response'''
+    response = send_without_fixtures(adapter, request, *args, **kwargs)
+    http_fixtures.setdefault(get_request_key(request), []).append(
+        {"status": response.status_code,
+         "reason": response.reason,
+         "headers": dict((header, value)
+                         for header, value in response.headers.items()
+                         if header.lower() not in SECRET_HEADERS),
+         "content": base64.b64encode(response.content).decode("ascii")})
+    return response
+
+
+def replay_send(adapter, request, *args, **kwargs):
+    '''Create the response to the request from the fixture archive.
+    # If the request was made more times than it was recorded,
+    # replay the last response again'''
+    request_key = get_request_key(request)
+    if request_key not in http_fixtures:
+        raise requests.ConnectionError(
+            "No recorded response for request: " + request_key,
+            request=request)
+    position = replayed_responses.get(request_key, 0)
+    recorded_responses = http_fixtures[request_key]
+    recorded = recorded_responses[min(position, len(recorded_responses) - 1)]
+    replayed_responses[request_key] = position + 1
+    response = requests.Response()
+    response.status_code = recorded["status"]
+    response.reason = recorded["reason"]
+    response.headers = CaseInsensitiveDict(recorded["headers"])
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = base64.b64decode(recorded["content"])
+    response.url = request.url
+    response.request = request
+    response.connection = adapter
+    return response
+
+
+def setup_http_fixtures(mode=None, archive_path=None):
+    '''Record or replay HTTP responses if ABQ_HTTP_MODE is set.
+    # A script can also set the mode and archive for its own fixtures'''
+    if mode is None:
+        mode = os.environ.get("ABQ_HTTP_MODE", "")
+    if archive_path is None:
+        archive_path = os.environ.get("ABQ_HTTP_ARCHIVE", HTTP_FIXTURES_FILE)
+    if mode == "record":
+        HTTPAdapter.send = record_send
+        atexit.register(save_http_fixtures, archive_path)
+        print("Recording HTTP responses for: ", archive_path)
+    elif mode == "replay":
+        http_fixtures.update(load_http_fixtures(archive_path))
+        HTTPAdapter.send = replay_send
+        print("Replaying HTTP responses from: ", archive_path)
+    elif mode:
+        print("ABQ_HTTP_MODE must be record or replay, not: ", mode)
+        sys.exit()
+
+
+def main():
+    '''HTTP fixtures module for Abiquo wiki scripts'''
+    print("This module records and replays the HTTP responses of scripts\n")
+    print("Set ABQ_HTTP_MODE to record or replay\n")
+
+
+# Calls the main() function
+if __name__ == '__main__':
+    main()
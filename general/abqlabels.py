@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+'''
+# Python script: general/abqlabels.py
+# ---------------------------------------
+# Module with a store of the UI labels in lang_en_US_labels.json
+# - Parse the labels file once and share it between scripts
+# - Get the labels with a prefix, e.g. "privilege." from a sorted key index
+#
+# The privileges and Configuration view scripts use this module
+'''
+
+import bisect
+import json
+import os
+from collections import namedtuple
+
+
+class LabelStore(namedtuple("LabelStore",
+                            ["file_stat", "labels", "sorted_keys",
+                             "positions"])):
+    '''UI labels by key, with the keys in sorted order for prefix
+    # queries and the position of each key in the labels file'''
+    __slots__ = ()
+
+
+# Label stores by file name, so each labels file is only loaded once
+label_stores = {}
+
+
+def build_label_store(file_stat, labels):
+    '''Build the sorted key index for the labels'''
+    positions = dict((key, position) for position, key in enumerate(labels))
+    return LabelStore(file_stat, labels, sorted(labels), positions)
+
+
+def load_label_store(labels_path):
+    '''Get the label store for a labels file.
+    # Parse the file only if it is not in memory or if its modification
+    # time or size have changed'''
+    labels_stat = os.stat(labels_path)
+    file_stat = (labels_stat.st_mtime_ns, labels_stat.st_size)
+    label_store = label_stores.get(labels_path)
+    if label_store and label_store.file_stat == file_stat:
+        return label_store
+    with open(labels_path, "r") as labels_file:
+        label_store = build_label_store(file_stat, json.load(labels_file))
+    label_stores[labels_path] = label_store
+    return label_store
+
+
+def get_labels(label_store, prefix):
+    '''Get the labels with keys that start with the prefix,
+    # in the same order as the labels file'''
+    start = bisect.bisect_left(label_store.sorted_keys, prefix)
+    end = start
+    while end < len(label_store.sorted_keys) \
+            and label_store.sorted_keys[end].startswith(prefix):
+        end += 1
+    keys = sorted(label_store.sorted_keys[start:end],
+                  key=label_store.positions.__getitem__)
+    return dict((key, label_store.labels[key]) for key in keys)
+
+
+def main():
+    '''UI labels module for Abiquo wiki scripts'''
+    print("This module has tools to get the UI labels\n")
+    print("It is used in the privileges and Configuration view scripts\n")
+
+
+# Calls the main() function
+if __name__ == '__main__':
+    main()
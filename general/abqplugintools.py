@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+'''
+# Python script: general/abqplugintools.py
+# ---------------------------------------
+# Module with tools to get the Abiquo plugin catalog for scripts
+# - Get the plugin types from the Abiquo API at the same time
+# - Save the plugin catalog in a file to reuse it
+# - Work offline with the last good plugin catalog
+#
+# The catalog file has the plugin types as the API returns them.
+# Scripts still make their own changes to the lists (e.g. add veeam)
+'''
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from abiquo.client import Abiquo
+from abiquo.auth import TokenAuth
+
+# Increase this if the format of the catalog file changes
+PLUGIN_CATALOG_VERSION = 1
+
+# Collection, key to get the plugin name, media type and description
+PLUGIN_COLLECTIONS = [
+    ("hypervisortypes", "name",
+     "application/vnd.abiquo.hypervisortypes+json", "hypervisor types"),
+    ("devicetypes", "name",
+     "application/vnd.abiquo.devicetypes+json", "device types"),
+    ("backupplugintypes", "type",
+     "application/vnd.abiquo.backupplugintypes+json", "backup plugin types"),
+    ("draasplugintypes", "type",
+     "application/vnd.abiquo.draasplugintypes+json", "DRaaS device types")]
+
+
+def connect_api():
+    '''Ask for the API URL and token and connect to the Abiquo API'''
+    token = input("Enter token: ")
+    api_url = input("Enter API URL: ")
+    return Abiquo(api_url, auth=TokenAuth(token), verify=False)
+
+
+def fetch_plugin_collection(api, session, plugin_collection):
+    '''Get one list of plugin types from the API with the shared session'''
+    collection, name_key, media_type, description = plugin_collection
+    endpoint = getattr(api.config, collection)
+    # The client creates a session for each URL, so share one instead
+    endpoint.session = session
+    code, plugin_types_list = endpoint.get(headers={'Accept': media_type})
+    print("Get " + description + ". Response code is: ", code)
+    if code != 200:
+        raise requests.HTTPError("Cannot get " + description
+                                 + ", response code " + str(code))
+    return [pt[name_key].lower()
+            for pt in plugin_types_list.json["collection"]]
+
+
+def fetch_plugin_catalog(api):
+    '''Get all the plugin types from the API at the same time.
+    # Keep the connections alive in one pooled session'''
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=len(PLUGIN_COLLECTIONS))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    with ThreadPoolExecutor(max_workers=len(PLUGIN_COLLECTIONS)) as executor:
+        plugin_lists = executor.map(
+            lambda pc: fetch_plugin_collection(api, session, pc),
+            PLUGIN_COLLECTIONS)
+        plugins = dict(zip([pc[0] for pc in PLUGIN_COLLECTIONS],
+                           plugin_lists))
+    session.close()
+    return {"version": PLUGIN_CATALOG_VERSION,
+            "apiUrl": api.url,
+            "fetched": time.time(),
+            "plugins": plugins}
+
+
+def load_plugin_catalog(catalog_path):
+    '''Load the last good plugin catalog or None if there isn't one'''
+    if not os.path.exists(catalog_path):
+        return None
+    with open(catalog_path, "r") as catalog_file:
+        catalog = json.load(catalog_file)
+    if catalog.get("version") != PLUGIN_CATALOG_VERSION:
+        print("Ignoring plugin catalog with old version: ", catalog_path)
+        return None
+    return catalog
+
+
+def save_plugin_catalog(catalog_path, catalog):
+    '''Save the plugin catalog, replacing the file only when it is complete'''
+    temp_path = catalog_path + ".tmp"
+    with open(temp_path, "w") as catalog_file:
+        json.dump(catalog, catalog_file, indent=2)
+    os.replace(temp_path, catalog_path)
+
+
+def get_plugin_catalog(catalog_path, ttl, offline=False):
+    '''Get the plugin catalog from the file if it is newer than ttl seconds
+    # or if working offline, otherwise from the API.
+    # If the API fails, use the last good plugin catalog'''
+    catalog = load_plugin_catalog(catalog_path)
+    if offline:
+        if catalog is None:
+            sys.exit("Cannot work offline without a plugin catalog: "
+                     + catalog_path)
+        print("Offline, using plugin catalog: ", catalog_path)
+        return catalog
+    if catalog and time.time() - catalog["fetched"] < ttl:
+        print("Using plugin catalog: ", catalog_path)
+        return catalog
+    try:
+        new_catalog = fetch_plugin_catalog(connect_api())
+    except (requests.RequestException, KeyError, ValueError) as error:
+        if catalog is None:
+            raise
+        print("Cannot get plugins from the API, using last plugin catalog: ",
+              error)
+        return catalog
+    save_plugin_catalog(catalog_path, new_catalog)
+    return new_catalog
+
+
+def main():
+    '''Plugin catalog tools module for Abiquo wiki scripts'''
+    print("This module has tools to get the Abiquo plugin catalog\n")
+    print("It is used in the properties scripts\n")
+
+
+# Calls the main() function
+if __name__ == '__main__':
+    main()
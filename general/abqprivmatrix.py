@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+'''
+# Python script: general/abqprivmatrix.py
+# ---------------------------------------
+# Module with a matrix of privileges and roles from the Abiquo API
+# - Each privilege has an integer with one bit for each role
+# - Check if a role has a privilege with the bit of the role
+# - Compare two API snapshots, e.g. from the last release, with XOR
+# - Create the table for the "Changes to privileges" page
+#
+# The privileges script saves an API snapshot for each run in
+# output_files/privileges_api_DATE.json
+#
+# Compare two snapshots from the general folder, for example:
+#   python3 abqprivmatrix.py output_files/privileges_api_2023-05-08.json
+#                            output_files/privileges_api_2023-10-26.json
+'''
+
+import json
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+NEW_PRIVILEGE = "New"
+REMOVED_PRIVILEGE = "Removed"
+CHANGED_PRIVILEGE = "Changed roles"
+
+# Wiki markup for the Info column of the Privileges page
+CHANGE_MARKS = {NEW_PRIVILEGE: "(*)",
+                REMOVED_PRIVILEGE: "(-)",
+                CHANGED_PRIVILEGE: "(!)"}
+
+
+class PrivilegeMatrix(namedtuple("PrivilegeMatrix",
+                                 ["privileges", "roles", "privilege_index",
+                                  "role_index", "grants"])):
+    '''Privileges and roles with the index of each name.
+    # grants[privilege number] has bit (1 << role number) set
+    # if the role has the privilege'''
+    __slots__ = ()
+
+
+def build_privilege_matrix(roles_data):
+    '''Build the matrix from the API privileges with a list of roles'''
+    privileges = tuple(sorted(roles_data))
+    roles = tuple(sorted(set(role for role_list in roles_data.values()
+                             for role in role_list)))
+    role_index = dict((role, number) for number, role in enumerate(roles))
+    grants = []
+    for privilege in privileges:
+        grant = 0
+        for role in roles_data[privilege]:
+            grant |= 1 << role_index[role]
+        grants.append(grant)
+    return PrivilegeMatrix(
+        privileges, roles,
+        dict((privilege, number) for number, privilege in enumerate(privileges)),
+        role_index, grants)
+
+
+def has_grant(matrix, privilege, role):
+    '''Check if the role has the privilege'''
+    if privilege not in matrix.privilege_index or role not in matrix.role_index:
+        return False
+    return bool(matrix.grants[matrix.privilege_index[privilege]]
+                >> matrix.role_index[role] & 1)
+
+
+def get_grant_roles(matrix, grant):
+    '''Get the names of the roles in a grant'''
+    return [role for number, role in enumerate(matrix.roles)
+            if grant >> number & 1]
+
+
+def align_grants(matrix, roles):
+    '''Get the grants of the matrix with the bits of another role tuple'''
+    if matrix.roles == roles:
+        return matrix.grants
+    bit_map = [(number, roles.index(role))
+               for number, role in enumerate(matrix.roles)]
+    return [sum(1 << new_number for number, new_number in bit_map
+                if grant >> number & 1)
+            for grant in matrix.grants]
+
+
+def diff_privilege_matrices(old_matrix, new_matrix):
+    '''Compare two snapshots of the privileges.
+    # Return (privilege, change, roles added, roles removed) sorted by name'''
+    roles = tuple(sorted(set(old_matrix.roles) | set(new_matrix.roles)))
+    union_matrix = PrivilegeMatrix((), roles, {}, {}, [])
+    old_grants = dict(zip(old_matrix.privileges,
+                          align_grants(old_matrix, roles)))
+    new_grants = dict(zip(new_matrix.privileges,
+                          align_grants(new_matrix, roles)))
+    changes = []
+    for privilege in sorted(old_grants.keys() | new_grants.keys()):
+        old_grant = old_grants.get(privilege, 0)
+        new_grant = new_grants.get(privilege, 0)
+        if privilege not in old_grants:
+            change = NEW_PRIVILEGE
+        elif privilege not in new_grants:
+            change = REMOVED_PRIVILEGE
+        elif old_grant ^ new_grant:
+            change = CHANGED_PRIVILEGE
+        else:
+            continue
+        changes.append((privilege, change,
+                        get_grant_roles(union_matrix, new_grant & ~old_grant),
+                        get_grant_roles(union_matrix, old_grant & ~new_grant)))
+    return changes
+
+
+def save_privilege_snapshot(snapshot_path, roles_data):
+    '''Save the privileges of the roles from the API'''
+    with open(snapshot_path, "w") as snapshot_file:
+        json.dump(roles_data, snapshot_file, indent=2, sort_keys=True)
+
+
+def load_privilege_matrix(snapshot_path):
+    '''Load a saved API snapshot as a matrix'''
+    with open(snapshot_path, "r") as snapshot_file:
+        return build_privilege_matrix(json.load(snapshot_file))
+
+
+def write_privilege_changes(changes, output_path, gui_labels=None):
+    '''Write the table for the "Changes to privileges" page in wiki markup.
+    # Use the UI names of privileges if there are gui_labels'''
+    gui_labels = gui_labels or {}
+    with open(output_path, "w") as cfile:
+        cfile.write("|| Privilege || API name || Change || Roles added "
+                    "|| Roles removed || Info ||\n")
+        for privilege, change, roles_added, roles_removed in changes:
+            cfile.write("| " + gui_labels.get(privilege, privilege)
+                        + " | " + privilege + " | " + change
+                        + " | " + (", ".join(roles_added) or " ")
+                        + " | " + (", ".join(roles_removed) or " ")
+                        + " | " + CHANGE_MARKS[change] + " |\n")
+
+
+def main():
+    '''Compare two API snapshots of privileges'''
+    if len(sys.argv) != 3:
+        print("Usage: python3 abqprivmatrix.py old_snapshot new_snapshot")
+        sys.exit()
+    changes = diff_privilege_matrices(load_privilege_matrix(sys.argv[1]),
+                                      load_privilege_matrix(sys.argv[2]))
+    for privilege, change, roles_added, roles_removed in changes:
+        print(change, privilege, "+" + ",".join(roles_added),
+              "-" + ",".join(roles_removed))
+    todays_date = datetime.today().strftime('%Y-%m-%d')
+    output_path = "output_files/privileges_changes_" + todays_date + ".txt"
+    write_privilege_changes(changes, output_path)
+    print("Wrote to file", output_path)
+
+
+# Calls the main() function
+if __name__ == '__main__':
+    main()
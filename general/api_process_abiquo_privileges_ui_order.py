@@ -24,12 +24,21 @@ import codecs
 import sys
 import pystache
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 import abqdoctools as adt
+import abqhttpfixtures as ahf
+import abqdocstore as adb
+import abqprivmatrix as apm
+import abqlabels as abl
 
 # reload(sys)
 # sys.setdefaultencoding('utf-8')
 
+# Maximum number of roles to get privileges for at the same time
+MAX_PRIVILEGE_WORKERS = 8
+
 
 class rolec:
     '''Role data structure with no methods left'''
@@ -92,53 +101,67 @@ def create_role_header(rollers):
     return roleheading
 
 
-def do_api_request(api_auth, api_url, api_accept):
-    '''Make a request to Abiquo API'''
+def do_api_request(api_auth, api_url, api_accept, session=None):
+    '''Make a request to Abiquo API, with a session to reuse connections'''
     # print (api_url)
     api_headers = {}
     api_headers['Accept'] = api_accept
     api_headers['Authorization'] = api_auth
-    api_data = requests.get(api_url, headers=api_headers, verify=False, timeout=60).json()
+    api_data = (session or requests).get(api_url, headers=api_headers,
+                                         verify=False, timeout=60).json()
     # print (api_data)
     return api_data
 
 
+def get_role_privileges(api_auth, api_ip, def_roleid, session):
+    '''Get the names of the privileges of a role'''
+    api_url = 'https://' + api_ip + '/api/admin/roles/' + \
+        str(def_roleid) + '/action/privileges'
+    print (api_url)
+    api_accept = 'application/vnd.abiquo.privileges+json'
+    default_privileges_response = do_api_request(api_auth, api_url,
+                                                 api_accept, session)
+    return [def_priv['name']
+            for def_priv in default_privileges_response['collection']]
+
+
 def get_api_privs(api_auth, api_ip):
     '''Get privileges from Abiquo API'''
     # Get role data from the API of a fresh Abiquo
     # First get roles and IDs, then get privileges of each role
     # rol_data = {}
     roles_data = {}
+    # Keep the connections alive in one pooled session
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1,
+                          pool_maxsize=MAX_PRIVILEGE_WORKERS)
+    session.mount("https://", adapter)
     # get all base role names and ID numbers
     api_url = 'https://' + api_ip + '/api/admin/roles/'
     api_accept = 'application/vnd.abiquo.roles+json'
-    default_roles_response = do_api_request(api_auth, api_url, api_accept)
+    default_roles_response = do_api_request(api_auth, api_url, api_accept,
+                                            session)
     default_roles_list = []
     default_roles = {}
     default_roles_list = default_roles_response['collection']
     # create a dictionary with the roles and their IDs
     for def_role in default_roles_list:
         default_roles[def_role['name']] = def_role['id']
-    # run through the dictionary and get the privileges for each role
-    for def_rolename, def_roleid in iter(default_roles.items()):
-        api_url = 'https://' + api_ip + '/api/admin/roles/' + \
-            str(def_roleid) + '/action/privileges'
-        print (api_url)
-        api_accept = 'application/vnd.abiquo.privileges+json'
-        default_privileges_response = do_api_request(api_auth,
-                                                     api_url, api_accept)
-        # create a list like the sql list, which is a privilege
-        # with a list of roles
-        default_privileges_list = []
-        default_privileges_list = default_privileges_response['collection']
-        for def_priv in default_privileges_list:
-            pname = def_priv['name']
-            if pname in roles_data:
-                roles_data[pname].append(def_rolename)
-            else:
-                roles_data[pname] = [def_rolename]
-    #            for rrr in roles_data:
-    #                print ("rrr: %s" % rrr)
+    # get the privileges for the roles at the same time
+    with ThreadPoolExecutor(max_workers=MAX_PRIVILEGE_WORKERS) as executor:
+        role_futures = {executor.submit(get_role_privileges, api_auth,
+                                        api_ip, def_roleid, session):
+                        def_rolename
+                        for def_rolename, def_roleid in default_roles.items()}
+        role_privileges = {}
+        for role_future in as_completed(role_futures):
+            role_privileges[role_futures[role_future]] = role_future.result()
+    session.close()
+    # create a list like the sql list, which is a privilege
+    # with a list of roles, in the order of the roles in the API
+    for def_rolename in default_roles:
+        for pname in role_privileges[def_rolename]:
+            roles_data.setdefault(pname, []).append(def_rolename)
     return roles_data
 
 
@@ -148,29 +171,27 @@ def get_gui_labels(input_gitdir, ui_label_file):
     privnames = {}
     privdescs = {}
     privgroups = {}
-    json_data = open(os.path.join(input_gitdir, ui_label_file))
-    data = json.load(json_data)
-#   labelkeys = sorted(data.keys())
-#   remove sort
-    labelkeys = data.keys()
-    for labelkey_orig in labelkeys:
+    label_store = abl.load_label_store(os.path.join(input_gitdir,
+                                                    ui_label_file))
+    for labelkey_orig, label in abl.get_labels(label_store,
+                                               "privilegegroup.").items():
         labelkey = labelkey_orig.split(".")
-        pri_group = labelkey[0]
-        if pri_group == "privilegegroup":
-            pri_group_key = labelkey[1]
-            if pri_group_key != "allprivileges":
-                privgroups[pri_group_key] = data[labelkey_orig]
-                # print ("privilege group: ", labelkey)
-        elif pri_group == "privilege":
-            pri_desc = labelkey[1]
-            if pri_desc == "description":
-                pri_desc_key= labelkey[2]
-                privdescs[pri_desc_key] = data[labelkey_orig]
-                # print("privilege description: ", labelkey)
-            elif pri_desc != "details":
-                privlabels[pri_desc] = pri_desc
-                privnames[pri_desc] = data[labelkey_orig]
-                # print("privilege: ", labelkey)
+        pri_group_key = labelkey[1]
+        if pri_group_key != "allprivileges":
+            privgroups[pri_group_key] = label
+            # print ("privilege group: ", labelkey)
+    for labelkey_orig, label in abl.get_labels(label_store,
+                                               "privilege.").items():
+        labelkey = labelkey_orig.split(".")
+        pri_desc = labelkey[1]
+        if pri_desc == "description":
+            pri_desc_key= labelkey[2]
+            privdescs[pri_desc_key] = label
+            # print("privilege description: ", labelkey)
+        elif pri_desc != "details":
+            privlabels[pri_desc] = pri_desc
+            privnames[pri_desc] = label
+            # print("privilege: ", labelkey)
     return (privlabels, privnames, privdescs, privgroups)
 
 
@@ -201,6 +222,10 @@ def process_roles(todays_date, input_gitdir, input_subdir, output_subdir):
     api_ip = input("Enter API address, e.g. api.abiquo.com: ")
 
     sqlroles = get_api_privs(api_auth, api_ip)
+    # Save the API privileges to compare with the next version
+    apm.save_privilege_snapshot(os.path.join(
+        output_subdir, "privileges_api_" + todays_date + ".json"), sqlroles)
+    priv_matrix = apm.build_privilege_matrix(sqlroles)
 
     # From the UI get the privilege names and descriptions,
     # with privilege appLabel as key
@@ -208,6 +233,19 @@ def process_roles(todays_date, input_gitdir, input_subdir, output_subdir):
     (privlabels, privnames, privdescs, privgroups) = \
         get_gui_labels(input_gitdir, ui_label_file)
 
+    # Create the table for the "Changes to privileges" page
+    previous_snapshot = input("Previous API privileges file to compare, e.g. "
+                              "output_files/privileges_api_2023-05-08.json "
+                              "(Enter to skip): ")
+    if previous_snapshot:
+        privilege_changes = apm.diff_privilege_matrices(
+            apm.load_privilege_matrix(previous_snapshot), priv_matrix)
+        changes_file = "privileges_changes_" + todays_date + ".txt"
+        apm.write_privilege_changes(privilege_changes,
+                                    os.path.join(output_subdir, changes_file),
+                                    privnames)
+        print("Wrote to file", changes_file)
+
     # From a list of roles that we set, create roles and role headers
     rollers = create_roles()
     rheaders = create_role_header(rollers)
@@ -234,7 +272,7 @@ def process_roles(todays_date, input_gitdir, input_subdir, output_subdir):
             priv_full_descs[pri] = privdescs[pri] + ". " + extratext[pri]
         # roleslist = []
         for rol in rollers:
-            if rol in sqlroles[pri]:
+            if apm.has_grant(priv_matrix, pri, rol):
                 if pri not in priv_full_roles:
                     priv_full_roles[pri] = []
                 priv_full_roles[pri].append(rol)
@@ -289,7 +327,25 @@ def process_roles(todays_date, input_gitdir, input_subdir, output_subdir):
     return privilege_out
 
 
+def get_privilege_store_rows(privilege_out, rollers):
+    '''Get the privileges and role grants for the doc store'''
+    privilege_rows = []
+    grant_rows = []
+    for category in privilege_out["categories"]:
+        for entry in category["entries"]:
+            privilege_rows.append((entry["appTag"], entry["guiLabel"],
+                                   category["category"], entry["privilege"]))
+            # The roles of an entry are in the same order as the rollers
+            for roller, role in zip(rollers.values(), entry["roles"]):
+                if "rolehas" in role["role"]:
+                    grant_rows.append((entry["appTag"], roller.rkey,
+                                       roller.rinitials))
+    return {"privileges": privilege_rows, "role_grants": grant_rows}
+
+
 def main():
+    # Record or replay the HTTP responses, see abqhttpfixtures.py
+    ahf.setup_http_fixtures()
     # todays_date = datetime.today().strftime('%Y-%m-%d')
     todays_date = "2023-10-26"
     input_gitdir = '../../platform/ui/app/lang'
@@ -308,6 +364,7 @@ def main():
         elif use_existing_file == "o":
             ef = open(os.path.join(output_subdir,privs_out_file), 'w')
 
+    privilege_out = None
     if ef:
         privilege_out = process_roles(todays_date, input_gitdir, input_subdir, output_subdir)
         with open(os.path.join(output_subdir,
@@ -344,6 +401,10 @@ def main():
 
     release_version = input("Release version, e.g. v463: ")
     print_version = input("Release print version, e.g. 4.6.3: ")
+    # Save the privileges of this release to compare with other releases
+    if privilege_out and release_version:
+        adb.save_release_rows(release_version, get_privilege_store_rows(
+            privilege_out, create_roles()))
     wiki_format = False
     update_page_title = "Privileges"
     table_replace_string = r'<table(.*?)</table>'
@@ -0,0 +1,214 @@
+#!/usr/bin/python3 -tt
+'''
+# Benchmark the properties pipeline in process_properties_table.py
+#
+# The script creates synthetic abiquo.properties files with:
+# - profile headers, e.g. "########## SERVER ##########"
+# - plugin separators, e.g. "#-- vmware"
+# - grouped plugin and metric properties
+# - descriptions with "Valid values"
+#
+# For each size it times and measures the peak memory of these stages:
+# - readFileGetProperties
+# - sort_for_output
+# - prepare_for_storage_format
+# - writeStorageFormatFile
+#
+# Results are added to output_files/properties_benchmark_history.json
+# so you can compare them with previous commits.
+# Run the script from the general folder, for example:
+#   python3 benchmark_properties.py 1000 10000 200000
+'''
+
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import process_properties_table as ppt
+
+DEFAULT_SIZES = [1000, 10000, 50000, 200000]
+HISTORY_FILE = "output_files/properties_benchmark_history.json"
+
+SYNTHETIC_PLUGINS = ["vmware", "kvm", "hyperv_301", "amazon", "azurecompute-arm",
+                     "oraclecloud", "gcp", "vcenter", "vcenter_cluster",
+                     "nsx-t", "nsx-nat", "veeam", "rubrik", "zerto"]
+SYNTHETIC_PROFILES = ["SERVER", "REMOTESERVICES", "V2VSERVICES",
+                      "COST USAGE", "SERVER REMOTESERVICES", "BILLING",
+                      "XAASAPI", "DNSMASQ"]
+SYNTHETIC_CATEGORIES = ["api", "server", "stale", "dvs", "vi", "redis",
+                        "rabbitmq", "storagemanager", "virtualfactory",
+                        "nodecollector", "monitoring", "guest", "esxi"]
+SYNTHETIC_DESCRIPTIONS = [
+    "Timeout in milliseconds for the 'remote' service to respond",
+    "URL of the server, e.g. http://abiquo.example.com/api",
+    "See https://wiki.abiquo.com/display/doc for <SERVER_IP_ADDRESS> details",
+    "Use ''select * from vm'' to check that the value is > 5 and < 10",
+    "Number of threads that the service uses - increase *carefully*",
+    "Enable the feature for all the enterprises in the platform"]
+SYNTHETIC_VALID_VALUES = ["true, false", "1-100", "positive integer",
+                          "[INFO, DEBUG, ERROR]"]
+
+
+def generate_properties_file(properties_path, property_count, seed=1):
+    '''Write a synthetic abiquo.properties file with about property_count
+    # properties and return the real number of properties'''
+    rnd = random.Random(seed)
+    count = 0
+    with open(properties_path, "w") as pfile:
+        pfile.write("# Abiquo Configuration Properties\n"
+                    "# Synthetic file for benchmarks\n\n")
+        while count < property_count:
+            if count % 50 == 0:
+                pfile.write("########## " + rnd.choice(SYNTHETIC_PROFILES)
+                            + " ##########\n\n")
+            category = rnd.choice(SYNTHETIC_CATEGORIES)
+            pfile.write("# " + rnd.choice(SYNTHETIC_DESCRIPTIONS) + "\n")
+            if rnd.random() < 0.3:
+                pfile.write("# Valid values: "
+                            + rnd.choice(SYNTHETIC_VALID_VALUES) + "\n")
+            kind = rnd.random()
+            if kind < 0.15:
+                # Plugin group with separators
+                for plugin in rnd.sample(SYNTHETIC_PLUGINS, rnd.randint(2, 6)):
+                    pfile.write("#-- " + plugin + "\n")
+                    pfile.write("# abiquo.%s.%s.prop%d=%d\n" % (
+                        category, plugin, count, rnd.choice([10, 10, 30])))
+                    count += 1
+            elif kind < 0.2:
+                # Metric group
+                for metric in rnd.sample(ppt.metrics, 4):
+                    pfile.write("# abiquo.esxi.metrics.%s.prop%d=%s\n" % (
+                        metric, count, rnd.choice(["true", "false"])))
+                    count += 1
+            else:
+                prefix = rnd.choice(["abiquo.", "abiquo.", "com.abiquo."])
+                pfile.write("# %s%s.prop%d=%s\n" % (
+                    prefix, category, count,
+                    rnd.choice(["", "10", "localhost:8080", "a=b"])))
+                count += 1
+            pfile.write("\n")
+    return count
+
+
+def run_stages(input_dir, properties_file, output_dir, group_types):
+    '''Run each stage of the pipeline and yield its name and result'''
+    properties_dict = ppt.read_properties(input_dir, properties_file,
+                                          group_types)
+    yield "readFileGetProperties", properties_dict
+    sorted_dict = ppt.sort_for_output(properties_dict)
+    yield "sort_for_output", sorted_dict
+    storage_format_dict = ppt.prepare_for_storage_format(
+        sorted_dict, ppt.profile_columns, ppt.newline_storage_format,
+        ppt.webrefs, ppt.default_profiles, ppt.plugin_blank_defaults,
+        ppt.profile_storage_format)
+    yield "prepare_for_storage_format", storage_format_dict
+    ppt.writeStorageFormatFile(storage_format_dict, output_dir,
+                               "benchmark_stformat.txt",
+                               ppt.deprecated_to_remove,
+                               "benchmark_test_sf.txt")
+    yield "writeStorageFormatFile", None
+
+
+def time_stages(input_dir, properties_file, output_dir, group_types):
+    '''Time each stage of the pipeline in seconds'''
+    seconds = {}
+    stages = run_stages(input_dir, properties_file, output_dir, group_types)
+    while True:
+        start = time.perf_counter()
+        try:
+            stage, _ = next(stages)
+        except StopIteration:
+            return seconds
+        seconds[stage] = round(time.perf_counter() - start, 4)
+
+
+def measure_stages(input_dir, properties_file, output_dir, group_types):
+    '''Measure the peak memory of each stage of the pipeline in bytes,
+    # not counting the memory that earlier stages still hold'''
+    peak_bytes = {}
+    stages = run_stages(input_dir, properties_file, output_dir, group_types)
+    tracemalloc.start()
+    while True:
+        stage_start_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        try:
+            stage, _ = next(stages)
+        except StopIteration:
+            tracemalloc.stop()
+            return peak_bytes
+        peak_bytes[stage] = \
+            tracemalloc.get_traced_memory()[1] - stage_start_bytes
+
+
+def get_git_commit():
+    '''Get the current commit so results can be compared between commits'''
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def load_history(history_file):
+    '''Load the benchmark history'''
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file, "r") as hfile:
+        return json.load(hfile)
+
+
+def print_result(result, previous):
+    '''Print a result and the change from the previous run of the same size'''
+    print("Properties: ", result["properties"])
+    for stage, seconds in result["seconds"].items():
+        change = ""
+        if previous and stage in previous["seconds"] \
+                and previous["seconds"][stage] > 0:
+            change = " (%+.0f%% from %s)" % (
+                100 * (seconds / previous["seconds"][stage] - 1),
+                previous["commit"])
+        print("  %-28s %9.4f s %12d bytes%s" % (
+            stage, seconds, result["peak_bytes"][stage], change))
+
+
+def main():
+    '''Benchmark the properties pipeline with synthetic files'''
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+    group_types = {"{plugin}": SYNTHETIC_PLUGINS, "{metric}": ppt.metrics}
+    history = load_history(HISTORY_FILE)
+    commit = get_git_commit()
+    run_date = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            properties_file = "abiquo_%d.properties" % size
+            property_count = generate_properties_file(
+                os.path.join(work_dir, properties_file), size)
+            result = {"date": run_date,
+                      "commit": commit,
+                      "size": size,
+                      "properties": property_count,
+                      "seconds": time_stages(work_dir, properties_file,
+                                             work_dir, group_types),
+                      "peak_bytes": measure_stages(work_dir, properties_file,
+                                                   work_dir, group_types)}
+            previous = None
+            for old_result in reversed(history):
+                if old_result["size"] == size:
+                    previous = old_result
+                    break
+            print_result(result, previous)
+            history.append(result)
+    with open(HISTORY_FILE, "w") as hfile:
+        json.dump(history, hfile, indent=2)
+    print("Wrote to file", HISTORY_FILE)
+
+
+# Calls the main() function
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/python3 -tt
+'''
+# Compare two revisions of the abiquo.properties file and create the
+# table for the "Changes to Abiquo configuration properties" page
+#
+# The script reports:
+# - added and removed properties
+# - renamed properties (same description, defaults and valid values)
+# - changed defaults, including the defaults of each plugin
+# - changed profiles
+# - changed valid values
+#
+# It uses the saved plugin catalog to find groups of properties,
+# so run process_properties_table.py first to save the catalog.
+#
+# Run the script from the general folder with the old and new files:
+#   python3 diff_properties.py old/abiquo.properties new/abiquo.properties
+# The output is a storage format table in output_files to paste
+# into the page with Edit storage format
+'''
+
+import html
+import os
+import sys
+import time
+from datetime import datetime
+import abqplugintools as apt
+import process_properties_table as ppt
+
+PLUGIN_CATALOG_FILE = "output_files/abiquo_plugin_catalog.json"
+
+ADDED = "Added"
+REMOVED = "Removed"
+RENAMED = "Renamed"
+CHANGED_DEFAULT = "Changed default"
+CHANGED_PLUGIN_DEFAULT = "Changed plugin default"
+ADDED_PLUGIN = "Added plugin"
+REMOVED_PLUGIN = "Removed plugin"
+CHANGED_PROFILES = "Changed profiles"
+CHANGED_VALID_VALUES = "Changed valid values"
+
+
+def read_revision(properties_path, group_types):
+    '''Read one revision of the properties file into a dict by name'''
+    return ppt.read_properties(os.path.dirname(properties_path) or ".",
+                               os.path.basename(properties_path),
+                               group_types)
+
+
+def get_content_key(propv):
+    '''Properties with the same content and a new name were renamed'''
+    return (propv.description, propv.default, propv.defaults,
+            propv.validvalues)
+
+
+def group_by_content(props_dict, prop_names):
+    '''Get the names of the properties with each content key'''
+    names_by_content = {}
+    for prop_name in prop_names:
+        names_by_content.setdefault(
+            get_content_key(props_dict[prop_name]), []).append(prop_name)
+    return names_by_content
+
+
+def find_renamed(old_dict, new_dict, removed, added):
+    '''Join the removed and added properties on their content.
+    # Only join a property when its content is not empty and exactly one
+    # removed and one added property have it.
+    # Return the pairs of (old name, new name)'''
+    removed_by_content = group_by_content(old_dict, removed)
+    added_by_content = group_by_content(new_dict, added)
+    renamed = []
+    for content_key, new_names in added_by_content.items():
+        old_names = removed_by_content.get(content_key, [])
+        if any(content_key) and len(old_names) == 1 and len(new_names) == 1:
+            renamed.append((old_names[0], new_names[0]))
+    return renamed
+
+
+def diff_property(prop_name, old_propv, new_propv):
+    '''Get the changes to a property as (name, change, old, new)'''
+    changes = []
+    if old_propv.default != new_propv.default:
+        changes.append((prop_name, CHANGED_DEFAULT,
+                        old_propv.default, new_propv.default))
+    if old_propv.defaults != new_propv.defaults:
+        old_defaults = dict(old_propv.defaults)
+        new_defaults = dict(new_propv.defaults)
+        for plugin in sorted(old_defaults.keys() | new_defaults.keys()):
+            if plugin not in new_defaults:
+                changes.append((prop_name, REMOVED_PLUGIN,
+                                plugin + "=" + old_defaults[plugin], ""))
+            elif plugin not in old_defaults:
+                changes.append((prop_name, ADDED_PLUGIN,
+                                "", plugin + "=" + new_defaults[plugin]))
+            elif old_defaults[plugin] != new_defaults[plugin]:
+                changes.append((prop_name, CHANGED_PLUGIN_DEFAULT,
+                                plugin + "=" + old_defaults[plugin],
+                                plugin + "=" + new_defaults[plugin]))
+    if set(old_propv.profiles) != set(new_propv.profiles):
+        changes.append((prop_name, CHANGED_PROFILES,
+                        ", ".join(old_propv.profiles),
+                        ", ".join(new_propv.profiles)))
+    if old_propv.validvalues != new_propv.validvalues:
+        changes.append((prop_name, CHANGED_VALID_VALUES,
+                        old_propv.validvalues or "",
+                        new_propv.validvalues or ""))
+    return changes
+
+
+def diff_properties(old_dict, new_dict):
+    '''Compare two revisions of the properties by name.
+    # Return the changes as (name, change, old, new) sorted by name'''
+    old_names = old_dict.keys()
+    new_names = new_dict.keys()
+    removed = sorted(old_names - new_names)
+    added = sorted(new_names - old_names)
+    renamed = find_renamed(old_dict, new_dict, removed, added)
+    renamed_old = set(old_name for old_name, _ in renamed)
+    renamed_new = set(new_name for _, new_name in renamed)
+
+    changes = []
+    for prop_name in added:
+        if prop_name not in renamed_new:
+            changes.append((prop_name, ADDED, "", new_dict[prop_name].default))
+    for prop_name in removed:
+        if prop_name not in renamed_old:
+            changes.append((prop_name, REMOVED,
+                            old_dict[prop_name].default, ""))
+    for old_name, new_name in renamed:
+        changes.append((new_name, RENAMED, old_name, new_name))
+        changes.extend(diff_property(new_name, old_dict[old_name],
+                                     new_dict[new_name]))
+    for prop_name in old_names & new_names:
+        if old_dict[prop_name] != new_dict[prop_name]:
+            changes.extend(diff_property(prop_name, old_dict[prop_name],
+                                         new_dict[prop_name]))
+    return sorted(changes, key=lambda change: change[0].lower())
+
+
+def write_changes_table(changes, output_path):
+    '''Write the changes as a storage format table'''
+    with open(output_path, "w") as cfile:
+        cfile.write("<table><tbody>\n<tr><th>Property</th><th>Change</th>"
+                    "<th>Old value</th><th>New value</th></tr>\n")
+        for prop_name, change, old_value, new_value in changes:
+            cfile.write("<tr><td><code>" + html.escape(prop_name)
+                        + "</code></td><td>" + change
+                        + "</td><td>" + html.escape(old_value)
+                        + "</td><td>" + html.escape(new_value)
+                        + "</td></tr>\n")
+        cfile.write("</tbody></table>\n")
+
+
+def main():
+    '''Compare two revisions of the properties file'''
+    if len(sys.argv) != 3:
+        print("Usage: python3 diff_properties.py old_file new_file")
+        sys.exit()
+    old_path, new_path = sys.argv[1:]
+    plugin_catalog = apt.load_plugin_catalog(PLUGIN_CATALOG_FILE)
+    if plugin_catalog is None:
+        print("Run process_properties_table.py to save the plugin catalog: ",
+              PLUGIN_CATALOG_FILE)
+        sys.exit()
+    group_types = ppt.get_group_types(plugin_catalog)
+
+    old_dict = read_revision(old_path, group_types)
+    new_dict = read_revision(new_path, group_types)
+    start = time.perf_counter()
+    changes = diff_properties(old_dict, new_dict)
+    diff_ms = (time.perf_counter() - start) * 1000
+    for prop_name, change, old_value, new_value in changes:
+        print("%-22s %s: %s -> %s" % (change, prop_name, old_value, new_value))
+    print("Found %d changes in %.1f ms" % (len(changes), diff_ms))
+
+    todaysDate = datetime.today().strftime('%Y-%m-%d')
+    output_file = "output_files/properties_changes_" + todaysDate + ".txt"
+    write_changes_table(changes, output_file)
+    print("Wrote to file", output_file)
+
+
+# Calls the main() function
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,9 @@
 # The main outputs a wiki text and a JSON labels file
 #
 # Save the wiki text in a separate file
-# Manually edit the APIError file to join the PSW-1 message lines
+# The script reads the wiki text as it is, with multi-line messages
+# and pipes in messages. It can also read APIError.java directly:
+#   python3 process_api_error_from_api_python3.py path/to/APIError.java
 #
 # For user's guide (User+Interface+Messages) and developer's guide (API+Error+Code+List)
 #
@@ -14,14 +16,72 @@
 # put the error messages into a dict in sections
 # sort the sections based on the last part of the id (whatever it may be)
 # print a header for each section
-# TODO: also need to compare with previous version's table 
-# and mark changed lines and print a diff file
-# and/or diff markers
+# To compare with the previous version, enter its input file at the prompt.
+# The script marks new and changed errors in the wiki guide tables
+# and writes a table of changes.
+# Or compare two versions without writing the guides:
+#   python3 process_api_error_from_api_python3.py --diff old_file new_file
 #
 
+import html
 import json
 import re
 import os
+import sys
+import time
+import abqdocstore as adb
+
+# Print the sort keys of the errors with: python3 process_api_error_from_api_python3.py -v
+VERBOSE = "-v" in sys.argv[1:]
+
+
+# A wiki record ends with the label column, e.g. "| PASSWORD_NOT_STRONG |"
+WIKI_RECORD = re.compile(r"^\|\s*(?P<id>[^|]*?)\s*\|\s?(?P<message>.*?)\s*"
+                         r"\|\s*(?P<label>\w+)\s*\|\s*$", re.DOTALL)
+# The start of the enum body in APIError.java
+JAVA_ENUM = re.compile(r"\benum\s+\w+[^{]*\{")
+# An enum constant, e.g. NON_EXISTENT_DATACENTER("DC-0", "..."),
+# with an optional class body
+JAVA_CONSTANT = re.compile(r"^(?P<label>[A-Za-z_]\w*)\s*\((?P<arguments>.*)\)"
+                           r"\s*(\{.*\})?$", re.DOTALL)
+# Java string and character literals, comments, brackets and separators
+JAVA_TOKEN = re.compile(r'''
+    "(?P<string>(?:[^"\\]|\\.)*)"
+  | '(?:[^'\\]|\\.)*'
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | [(){},;]
+  | [^"'(){},;/]+
+  | /
+''', re.VERBOSE | re.DOTALL)
+JAVA_ESCAPES = {"n": "\n", "t": " ", "r": ""}
+
+# Characters that are escaped in the messages for one of the output formats.
+# Splitting a message on them gives the pieces to render with each format
+# A new line in a message is a line break in each format
+MESSAGE_SPECIALS = re.compile(r"(\\\\|[|\-{}\[\]<>&\n])")
+WIKI_ESCAPES = {"\\\\": "\\\\\\\\", "|": "\\|", "-": "\\-",
+                "{": "&#123;", "}": "&#125;", "[": "&#91;", "]": "&#93;",
+                "\n": "\\\\"}
+MARKDOWN_ESCAPES = {"|": "\\|", "<": "&lt;", ">": "&gt;", "\n": "<br/>"}
+STORAGE_FORMAT_ESCAPES = {"<": "&lt;", ">": "&gt;", "&": "&amp;",
+                          "\n": "<br />"}
+
+NEW_ERROR = "New"
+REMOVED_ERROR = "Removed"
+REWORDED_ERROR = "Reworded"
+RELABELLED_ERROR = "Relabelled"
+
+# Wiki markup for the changes, after the ID in the guide tables
+CHANGE_MARKS = {NEW_ERROR: "(*)",
+                REMOVED_ERROR: "(-)",
+                REWORDED_ERROR: "(!)",
+                RELABELLED_ERROR: "(!)"}
+
+# Size of the write buffer of the output files
+OUTPUT_BUFFER_SIZE = 1 << 16
+
+# Text and the number after it, for each segment of an error ID
+NATURAL_SEGMENTS = re.compile(r"(\D*)(\d*)")
 
 
 class ApiErrorLine:
@@ -30,23 +90,248 @@ class ApiErrorLine:
         self.label=a_label
         self.internal_message_id=a_internal_message_id
         self.message=a_message
+        # Compute the sort key once, when the error is parsed
+        self.sort_key=natural_sort_key(a_internal_message_id)
+        # Split the message once for all the output formats
+        self.message_pieces=MESSAGE_SPECIALS.split(a_message)
+        self.wiki_message=render_message(self.message_pieces, WIKI_ESCAPES)
+        # Diff marker for the wiki guides, if there is a previous version
+        self.change_mark=""
 
     def string_admin(self):
         '''Admin guide line'''
         wiki_label = self.label
-        wiki_internal_message_id = self.internal_message_id.strip("\"")
-        wiki_message = dowikimarkup(self.message)
-        return '| %s | %s | %s |\n' % (wiki_internal_message_id, wiki_message, wiki_label)
+        wiki_internal_message_id = self.internal_message_id.strip("\"") + self.change_mark
+        return '| %s | %s | %s |\n' % (wiki_internal_message_id, self.wiki_message, wiki_label)
 
     def string_user(self):
         '''User guide line'''
-        wiki_internal_message_id = self.internal_message_id.strip("\"")
-    #   wiki_message = self.message.strip("\"")
-    #   wiki_message = re.sub("\|","\\\|",wiki_message)
-    #   wiki_message = re.sub("-","\\\-",wiki_message)
-        wiki_message = dowikimarkup(self.message)
-    #   print("| ",wiki.internal_message_id," | ",wiki.message," |")
-        return '| %s | %s |\n' % (wiki_internal_message_id, wiki_message)
+        wiki_internal_message_id = self.internal_message_id.strip("\"") + self.change_mark
+        return '| %s | %s |\n' % (wiki_internal_message_id, self.wiki_message)
+
+    def string_markdown(self):
+        '''Markdown admin guide line'''
+        return '| %s | %s | %s |\n' % (
+            self.internal_message_id.strip("\""),
+            render_message(self.message_pieces, MARKDOWN_ESCAPES), self.label)
+
+    def string_storage_format(self):
+        '''Storage format admin guide line'''
+        return '<tr><td>%s</td><td>%s</td><td>%s</td></tr>\n' % (
+            html.escape(self.internal_message_id.strip("\"")),
+            render_message(self.message_pieces, STORAGE_FORMAT_ESCAPES),
+            self.label)
+
+    def string_ui_label(self):
+        '''UI labels file line'''
+        return '\t"server.error.%s" : %s' % (
+            self.internal_message_id.strip("\""),
+            json.dumps(self.message, ensure_ascii=False))
+
+
+def render_message(message_pieces, escapes):
+    '''Join the pieces of a message with the escapes of an output format'''
+    return "".join([escapes.get(piece, piece) for piece in message_pieces])
+
+
+def compile_section_matcher(section_data):
+    '''Compile the section patterns into one regex with a named group
+    # for each section, in the order of the sections file.
+    # Return the regex and the section names by group name'''
+    section_names = {}
+    section_patterns = []
+    for section_number, (section, pattern) in enumerate(section_data.items()):
+        group_name = "section" + str(section_number)
+        section_names[group_name] = section
+        section_patterns.append("(?P<" + group_name + ">" + pattern + ")")
+    return re.compile("|".join(section_patterns)), section_names
+
+
+def get_error_section(section_matcher, section_names, ae_id):
+    '''Get the first section that matches the error ID, or None'''
+    section_match = section_matcher.match(ae_id)
+    if section_match is None:
+        return None
+    return section_names[section_match.lastgroup]
+
+
+def read_wiki_records(input_file):
+    '''Yield the records of the APIError wiki text, joining the lines
+    # of multi-line messages with their new lines. A line that starts with
+    # a pipe starts a new record only if the record before it has its label column'''
+    record = ""
+    for line in input_file:
+        line = line.rstrip("\r\n")
+        if record and (WIKI_RECORD.match(record) is None
+                       or not line.startswith("|")):
+            record = record + "\n" + line
+            continue
+        if record:
+            yield record
+        record = line if line.strip() else ""
+    if record:
+        yield record
+
+
+def read_wiki_api_errors(input_file):
+    '''Yield the API errors in the APIError wiki text.
+    # The message is everything between the ID and the label,
+    # so it can contain pipes'''
+    for record in read_wiki_records(input_file):
+        record_match = WIKI_RECORD.match(record)
+        if record_match is None:
+            print("Not an API error line: ", record)
+            continue
+        yield ApiErrorLine(record_match.group("id"),
+                           record_match.group("message"),
+                           record_match.group("label"))
+
+
+def unescape_java(java_string):
+    '''Replace the escape sequences in a Java string literal'''
+    return re.sub(r"\\(.)", lambda escape: JAVA_ESCAPES.get(
+        escape.group(1), escape.group(1)), java_string)
+
+
+def iter_java_tokens(java_text):
+    '''Yield the tokens of Java code without the comments,
+    # with the depth of brackets before each token'''
+    depth = 0
+    for token in JAVA_TOKEN.finditer(java_text):
+        if token.group("comment"):
+            continue
+        text = token.group()
+        if text in (")", "}"):
+            depth -= 1
+        yield (token, depth)
+        if text in ("(", "{"):
+            depth += 1
+
+
+def iter_java_constants(java_source):
+    '''Yield the text of each constant in the enum body,
+    # splitting the body at the commas outside brackets,
+    # until the semicolon or the end of the enum'''
+    enum_start = JAVA_ENUM.search(java_source)
+    if enum_start is None:
+        print("No enum in the Java file")
+        return
+    constant = []
+    for (token, depth) in iter_java_tokens(java_source[enum_start.end():]):
+        text = token.group()
+        if depth < 0 or (depth == 0 and text in (",", ";")):
+            yield "".join(constant).strip()
+            if text != ",":
+                return
+            constant = []
+        else:
+            constant.append(text)
+    yield "".join(constant).strip()
+
+
+def get_java_arguments(arguments_text):
+    '''Get the arguments of an enum constant, joining the string
+    # literals that are concatenated with +. An argument without
+    # string literals is None'''
+    arguments = [None]
+    for (token, depth) in iter_java_tokens(arguments_text):
+        if depth == 0 and token.group() == ",":
+            arguments.append(None)
+        elif depth == 0 and token.group("string") is not None:
+            arguments[-1] = (arguments[-1] or "") \
+                + unescape_java(token.group("string"))
+    return arguments
+
+
+def read_java_api_errors(input_file):
+    '''Yield the API errors in the enum constants of APIError.java,
+    # e.g. NON_EXISTENT_DATACENTER("DC-0", "The requested datacenter does not exist"),
+    # A constant can be on several lines or share a line with others'''
+    for constant in iter_java_constants(input_file.read()):
+        if not constant:
+            continue
+        constant_match = JAVA_CONSTANT.match(constant)
+        arguments = []
+        if constant_match:
+            arguments = get_java_arguments(constant_match.group("arguments"))
+        if len(arguments) < 2 or None in arguments[:2]:
+            print("Cannot read the API error constant: ", constant)
+            continue
+        yield ApiErrorLine(arguments[0].strip(), arguments[1].strip(),
+                           constant_match.group("label"))
+
+
+def read_api_errors(input_path):
+    '''Yield the API errors from the APIError wiki text or APIError.java'''
+    with open(input_path, "r", encoding="utf-8") as input_file:
+        if input_path.endswith(".java"):
+            yield from read_java_api_errors(input_file)
+        else:
+            yield from read_wiki_api_errors(input_file)
+
+
+def load_api_errors(input_path):
+    '''Load the API errors of a version by internal message ID'''
+    return dict((error.internal_message_id, error)
+                for error in read_api_errors(input_path))
+
+
+def diff_api_errors(old_errors, new_errors):
+    '''Compare two versions of the API errors by internal message ID.
+    # Return (ID, change, old value, new value) sorted by ID'''
+    changes = []
+    for error_id, new_error in new_errors.items():
+        old_error = old_errors.get(error_id)
+        if old_error is None:
+            changes.append((error_id, NEW_ERROR, "", new_error.message))
+            continue
+        if old_error.message != new_error.message:
+            changes.append((error_id, REWORDED_ERROR, old_error.message,
+                            new_error.message))
+        if old_error.label != new_error.label:
+            changes.append((error_id, RELABELLED_ERROR, old_error.label,
+                            new_error.label))
+    for error_id in old_errors.keys() - new_errors.keys():
+        changes.append((error_id, REMOVED_ERROR, old_errors[error_id].message,
+                        ""))
+    return sorted(changes, key=lambda change: natural_sort_key(change[0]))
+
+
+def mark_api_error_changes(changes, new_errors):
+    '''Add the diff markers to the new and changed errors'''
+    for error_id, change, _, _ in changes:
+        if error_id in new_errors:
+            new_errors[error_id].change_mark = " " + CHANGE_MARKS[change]
+
+
+def write_api_error_changes(changes, output_path):
+    '''Write the table of changes to the API errors in wiki markup'''
+    with open(output_path, "w", buffering=OUTPUT_BUFFER_SIZE) as cfile:
+        cfile.write("|| Internal Message ID || Change || Old value "
+                    "|| New value || Info ||\n")
+        cfile.write("".join(["| " + error_id + " | " + change
+                             + " | " + (dowikimarkup(old_value) or " ")
+                             + " | " + (dowikimarkup(new_value) or " ")
+                             + " | " + CHANGE_MARKS[change] + " |\n"
+                             for error_id, change, old_value, new_value
+                             in changes]))
+
+
+def diff_main(old_path, new_path, changes_path):
+    '''Compare two versions of the API errors and write the changes'''
+    start = time.perf_counter()
+    old_errors = load_api_errors(old_path)
+    new_errors = load_api_errors(new_path)
+    loaded = time.perf_counter()
+    changes = diff_api_errors(old_errors, new_errors)
+    diffed = time.perf_counter()
+    write_api_error_changes(changes, changes_path)
+    for change_type in CHANGE_MARKS:
+        print(change_type, "errors: ",
+              sum(1 for change in changes if change[1] == change_type))
+    print("Load time: %.1f ms, diff time: %.1f ms" % (
+        (loaded - start) * 1000, (diffed - loaded) * 1000))
+    print("Wrote to file", changes_path)
 
 
 def main():
@@ -59,6 +344,19 @@ def main():
 
     api_error_file_admin = "wiki_api_error_admin_guide_" + todays_date + ".txt"
     api_error_file_user = "wiki_api_error_user_guide_" + todays_date + ".txt"
+    api_error_file_markdown = "md_api_error_admin_guide_" + todays_date + ".md"
+    api_error_file_storage = "sf_api_error_admin_guide_" + todays_date + ".txt"
+    api_error_file_ui = "ui_api_error_labels_" + todays_date + ".json"
+    api_error_file_changes = "api_error_changes_" + todays_date + ".txt"
+
+    input_args = [arg for arg in sys.argv[1:] if arg != "-v"]
+    if input_args[:1] == ["--diff"]:
+        if len(input_args) != 3:
+            print("Usage: python3 process_api_error_from_api_python3.py --diff old_file new_file")
+            sys.exit()
+        diff_main(input_args[1], input_args[2],
+                  os.path.join(output_subdir, api_error_file_changes))
+        return
 
     admin_header = "|| Internal Message ID {color:#efefef}__________________{color}" \
         + "|| Message {color:#efefef}____________________________________________________________" \
@@ -68,28 +366,74 @@ def main():
         + "|| Message {color:#efefef}____________________________________________________________" \
         + "{color} ||\n"
 
+    markdown_header = "| Internal Message ID | Message | Identifier |\n|---|---|---|\n"
+
+    storage_header = "<table><tbody>\n<tr><th>Internal Message ID</th>" \
+        + "<th>Message</th><th>Identifier</th></tr>\n"
+
+    # Output files with their header, section line, error line and footer
+    api_error_outputs = [
+        (api_error_file_admin, admin_header,
+         lambda section: "|| h6. " + section + " ||  ||  ||\n",
+         ApiErrorLine.string_admin, ""),
+        (api_error_file_user, user_header,
+         lambda section: "|| h6. " + section + " ||  ||\n",
+         ApiErrorLine.string_user, ""),
+        (api_error_file_markdown, markdown_header,
+         lambda section: "| **" + section + "** | | |\n",
+         ApiErrorLine.string_markdown, ""),
+        (api_error_file_storage, storage_header,
+         lambda section: "<tr><th colspan=\"3\"><h6>" + html.escape(section) + "</h6></th></tr>\n",
+         ApiErrorLine.string_storage_format, "</tbody></table>\n")]
+
     sections_json = "apierror_sections.json"
     api_error_sections_data = open(sections_json, "r")
     section_data = json.load(api_error_sections_data)
     api_error_sections_data.close()
-    section_keys = sorted(section_data.keys())
+    # The first section in the file that matches an error wins
+    section_matcher, section_names = compile_section_matcher(section_data)
+    unmatched_errors = []
 
-    apie_error_formats = [ae.strip() for ae in open(os.path.join(input_subdir,api_error_input_file))]
+    # The input file is the APIError wiki text or APIError.java
+    if input_args:
+        api_error_input_path = input_args[0]
+    else:
+        api_error_input_path = os.path.join(input_subdir,api_error_input_file)
 
-    for apierr in apie_error_formats:
+    # Write the UI labels in the order of the input file, as they are read
+    outfile_ui = open(os.path.join(output_subdir,api_error_file_ui), 'w', buffering=OUTPUT_BUFFER_SIZE)
+    outfile_ui.write("{\n")
+    ui_separator = ""
+    all_errors = {}
+    for aeline in read_api_errors(api_error_input_path):
+        all_errors[aeline.internal_message_id] = aeline
+        outfile_ui.write(ui_separator + aeline.string_ui_label())
+        ui_separator = ",\n"
+        skey = get_error_section(section_matcher, section_names, aeline.internal_message_id)
+        if skey is None:
+            unmatched_errors.append(aeline.internal_message_id)
+        else:
+            error_lines.setdefault(skey, []).append(aeline)
 
-        apierr_line = re.split('(?<!=)\|',apierr)
+    outfile_ui.write("\n}\n")
+    outfile_ui.close()
 
-        ae_id = apierr_line[1].strip()
-        ae_msg = apierr_line[2].strip()
-        ae_lab = apierr_line[3].strip()
+    # Add sections for these errors to apierror_sections.json
+    for ae_id in unmatched_errors:
+        print("No section for API error: ", ae_id)
+    print("API errors without a section: ", len(unmatched_errors))
 
-        aeline = ApiErrorLine(ae_id,ae_msg,ae_lab)
-        for skey in section_keys:
-            if re.match(section_data[skey],ae_id):
-                error_lines.setdefault(skey, []).append(aeline)
-                # print "section_data[skey]: " + section_data[skey] +
-                #    skey: " + skey + " ae_id: " + ae_id
+    # Mark the changes in the guides and create the table of changes
+    previous_input = input("Previous API errors file to compare, e.g. "
+                           "input_files/apierrors_wiki_2022-08-17.txt "
+                           "(Enter to skip): ")
+    if previous_input:
+        error_changes = diff_api_errors(load_api_errors(previous_input),
+                                        all_errors)
+        mark_api_error_changes(error_changes, all_errors)
+        write_api_error_changes(error_changes,
+                                os.path.join(output_subdir, api_error_file_changes))
+        print("Wrote to file", api_error_file_changes)
 
 
     error_key_list = list(error_lines.keys())
@@ -101,54 +445,51 @@ def main():
     error_key_list.insert(0,"Status codes")
 
 
-    outfile_admin = open(os.path.join(output_subdir,api_error_file_admin), 'w')
-    outfile_user = open(os.path.join(output_subdir,api_error_file_user), 'w')
-
-    outfile_admin.write (admin_header)
-    outfile_user.write (user_header)
+    # Write each section to all the output files in one pass over its errors
+    outfiles = [open(os.path.join(output_subdir,output_file), 'w', buffering=OUTPUT_BUFFER_SIZE)
+                for output_file, _, _, _, _ in api_error_outputs]
+    for outfile, (_, header, _, _, _) in zip(outfiles, api_error_outputs):
+        outfile.write(header)
 
     for error_item in error_key_list:
-        ss_interest = sorted(error_lines[error_item], key = lambda XX: padkey(XX.internal_message_id))
-        admin_header_line =  "|| h6. " + error_item + " ||  ||  ||\n"
-        outfile_admin.write(admin_header_line)
-        user_header_line = "|| h6. " + error_item + " ||  ||\n"
-        outfile_user.write(user_header_line)
+        ss_interest = sorted(error_lines[error_item], key = lambda XX: XX.sort_key)
+        section_lines = [[section_line(error_item)]
+                         for _, _, section_line, _, _ in api_error_outputs]
         for interest in ss_interest:
-            outfile_admin.write(interest.string_admin())
-            outfile_user.write(interest.string_user())
+            for output_lines, (_, _, _, error_line, _) in zip(section_lines, api_error_outputs):
+                output_lines.append(error_line(interest))
+        for outfile, output_lines in zip(outfiles, section_lines):
+            outfile.write("".join(output_lines))
+
+    for outfile, (_, _, _, _, footer) in zip(outfiles, api_error_outputs):
+        outfile.write(footer)
+        outfile.close()
 
-    outfile_admin.close()
-    outfile_user.close()
+    # Save the errors of this release to compare with other releases
+    release_version = input("Release version for the doc store, e.g. v463 (Enter to skip): ")
+    if release_version:
+        error_rows = [(error_item, error.internal_message_id.strip("\""),
+                       error.message, error.label)
+                      for error_item in error_key_list
+                      for error in error_lines[error_item]]
+        adb.save_release_rows(release_version, {"api_errors": error_rows})
 
 
 def dowikimarkup(my_wiki_message):
     '''Create wiki markup'''
-    a_wiki_message = my_wiki_message.replace(r"\\",r"\\\\")
-    a_wiki_message = re.sub("\|","\\\|",a_wiki_message)
-    a_wiki_message = re.sub("-","\\\-",a_wiki_message)
-#   a_wiki_message = a_wiki_message.strip("\"")
-#   a_wiki_message = re.sub(r"\\\\\|",r"\\\|",a_wiki_message)
-    a_wiki_message = a_wiki_message.replace("{",r"&#123;")
-    a_wiki_message = a_wiki_message.replace("}",r"&#125;")
-    a_wiki_message = a_wiki_message.replace("[",r"&#91;")
-    a_wiki_message = a_wiki_message.replace("]",r"&#93;")
-    return a_wiki_message
-
-
-def padkey(mg_id):
-    '''Pad the keys'''
-    idbreakup = re.search("(^.+?)((\d*)$)",mg_id)
-    print("My ID: ", idbreakup.group(1))
-    print("My No: ", idbreakup.group(2))
-    mynumber = idbreakup.group(2)
-
-    if re.match("\d",mynumber):
-        realnumber = int(mynumber)
-        hello = "{0:05d}".format(realnumber)
-        finalmg = re.sub("\d+$",hello,mg_id)
-    else:
-        finalmg = mg_id
-    return finalmg
+    return render_message(MESSAGE_SPECIALS.split(my_wiki_message), WIKI_ESCAPES)
+
+
+def natural_sort_key(mg_id):
+    '''Get a sort key with the numbers in the ID as integers,
+    # so VM-3 sorts before VM-12, e.g. LIMIT-12 is (("LIMIT-", 12),)
+    # and 400-BAD-REQUEST is (("", 400), ("-BAD-REQUEST", -1))'''
+    sort_key = tuple((text, int(number) if number else -1)
+                     for text, number in NATURAL_SEGMENTS.findall(mg_id)
+                     if text or number)
+    if VERBOSE:
+        print("Sort key: ", mg_id, sort_key)
+    return sort_key
 
 
 # Calls the main() function
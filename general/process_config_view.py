@@ -18,16 +18,20 @@ Dependencies:
 # import sys
 import re
 import os
-import json
 # import requests
 # import readline
 # import copy
 from abiquo.client import Abiquo
 from abiquo.auth import TokenAuth
 from datetime import datetime
+import abqhttpfixtures as ahf
+import abqdocstore as adb
+import abqlabels as abl
 
 
 def main():
+    # Record or replay the HTTP responses, see abqhttpfixtures.py
+    ahf.setup_http_fixtures()
     td = datetime.today().strftime('%Y-%m-%d')
     # td = "2021-11-17"
 
@@ -92,18 +96,16 @@ def main():
 
     # Process the language file which has keys and UI labels
     ui_json = ui_path_lang + "lang_en_US_labels.json"
-    ui_json_data = open(ui_json)
-    ui_data = json.load(ui_json_data)
+    label_store = abl.load_label_store(ui_json)
 
     # Get UI labels for properties
-    uiLabels = dict(filter(lambda elem: "configuration.systemproperties"
-                           in elem[0]
-                           and ".desc" not in elem[0], ui_data.items()))
+    uiLabels = dict(
+        (labelKey, label) for labelKey, label in abl.get_labels(
+            label_store, "configuration.systemproperties").items()
+        if ".desc" not in labelKey)
     # Get UI labels for wiki links and tab headers
-    mainmenuLabels = dict(filter(lambda elem: "mainmenu.button" in elem[0],
-                                 ui_data.items()))
-    configTabLabels = dict(filter(lambda elem: "configuration.tab" in elem[0],
-                           ui_data.items()))
+    mainmenuLabels = abl.get_labels(label_store, "mainmenu.button")
+    configTabLabels = abl.get_labels(label_store, "configuration.tab")
     # get my extra text from file in input files input_files
     extraText = {}
     with open(os.path.join(input_subdir,
@@ -143,6 +145,8 @@ def main():
 
     outputOrder = []
     outputWikiLik = []
+    # Settings for the doc store
+    settingRows = []
 
     for hL in htmlLabels:
         # print ("hL: ", hL)
@@ -209,6 +213,10 @@ def main():
                     else:
                         outputList.append(" ")
 
+                settingRows.append((uiLabels.get(label, ""), valueKey,
+                                    configDict.get(valueKey, ""),
+                                    extraText.get(valueKey, "")))
+
                 wikiText = re.search(wikiRegex, valueKey)
                 if wikiText:
                     wikiLinkEntry = True
@@ -237,6 +245,11 @@ def main():
         outwikifile.write(wikiLine + "\n")
     outwikifile.close()
 
+    # Save the settings of this release to compare with other releases
+    release_version = input("Release version for the doc store, e.g. v463 (Enter to skip): ")
+    if release_version:
+        adb.save_release_rows(release_version, {"config_settings": settingRows})
+
 
 # Calls the main() function
 if __name__ == '__main__':
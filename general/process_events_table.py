@@ -3,23 +3,95 @@
 
 import re
 import os
+import json
 from datetime import datetime
+from itertools import groupby
 import abqdoctools as adt
+import abqhttpfixtures as ahf
+import abqdocstore as adb
 
 SEVERITY = [("INFO", "(i)"), ("WARN", "(!)"), ("ERROR", "(-)")]
+# Key for the entity and action at the end of a word path in the trie
+TRIE_END = ""
 outputSubdir = "output_files"
 todaysDate = datetime.today().strftime('%Y-%m-%d')
 # todaysDate = "2021-11-03"
 wikiEventTracerFile = "wiki_event_tracer_all_" + todaysDate + ".txt"
+jsonEventTracerFile = "event_tracer_all_" + todaysDate + ".json"
+# Fields of the tracer rows, as in the doc store
+TRACER_FIELDS = ["entity", "action", "severity", "message", "privileges"]
 updatePageTitle = "Events table"
-tableReplaceString = r'<table(.*?)</table>'
 wikiFormat = True
 operation = "replace"
 
 
-def main():
-    header = "|| Entity || Action || Severity || Tracer || Event privileges ||\n"
+def build_entity_action_trie(entityActionList):
+    '''Build a trie of the words of each entity_action,
+    # e.g. VIRTUAL_MACHINE_CREATE is VIRTUAL -> MACHINE -> CREATE'''
+    trie = {}
+    for (entity, action, entityAction) in entityActionList:
+        node = trie
+        for word in entityAction.split("_"):
+            node = node.setdefault(word, {})
+        node.setdefault(TRIE_END, (entity, action))
+    return trie
+
+
+def get_severity(words):
+    '''Get the first severity type (INFO, WARN, ERROR) in the words'''
+    for word in words:
+        for (severity, severityCode) in SEVERITY:
+            if word.startswith(severity):
+                return severity
+    return None
+
+
+def parse_tracer_key(trie, tracerPropertyKey):
+    '''Parse a tracer key into (entity, action, severity), or None.
+    # Use the longest entity_action in the trie with a severity after it,
+    # so that VM_CREATE_FROM_INFO is VM_CREATE_FROM and not VM_CREATE'''
+    words = re.split("[_.]", tracerPropertyKey)
+    for start in range(len(words)):
+        node = trie
+        matches = []
+        for position in range(start, len(words)):
+            node = node.get(words[position])
+            if node is None:
+                break
+            if TRIE_END in node:
+                matches.append((node[TRIE_END], position + 1))
+        for ((entity, action), end) in reversed(matches):
+            severity = get_severity(words[end:])
+            if severity is not None:
+                return (entity, action, severity)
+    return None
+
+
+def get_tracer_sort_key(tracerRow):
+    '''Sort tracers by entity and action, then severity in table order,
+    # (!) WARN, (-) ERROR, (i) INFO, and message'''
+    (entity, action, severity, message, privileges) = tracerRow
+    return (entity, action, dict(SEVERITY)[severity], message, privileges)
+
+
+def iter_events_table(sortedTracerRows):
+    '''Yield the lines of the events table in wiki markup,
+    # with a header line before the tracers of each entity'''
+    yield "|| Entity || Action || Severity || Tracer || Event privileges ||\n"
+    severityCodes = dict(SEVERITY)
+    for entity, entityRows in groupby(sortedTracerRows,
+                                      key=lambda tracerRow: tracerRow[0]):
+        yield "||  h6. " + entity.replace("_", " ").capitalize() + \
+            " ||  ||  ||  ||  ||\n"
+        for (entity, action, severity, message, privileges) in entityRows:
+            yield "| " + entity + " | " + action + " | " + \
+                severityCodes[severity] + " | " + message + " | " + \
+                privileges + " |\n"
+
 
+def main():
+    # Record or replay the HTTP responses, see abqhttpfixtures.py
+    ahf.setup_http_fixtures()
     # Read the entity action file
     tracerEntitiesDir = "../../platform/api/src/main/generated"
     tracerEntitiesFileName = "tracer.entities"
@@ -38,7 +110,8 @@ def main():
     eventSecurityPropertyFile = [es.strip() for es in open(os.path.join(
         eventSecurityPropertiesDir, eventSecurityPropertiesFileName))]
 
-    tracerList = []
+    # Events for the table, JSON file and doc store
+    tracerRows = []
     entityActionList = []
     securityDict = {}
 
@@ -51,6 +124,7 @@ def main():
         for action in actionsList:
             entityAction = entity + "_" + action
             entityActionList.append((entity, action, entityAction))
+    entityActionTrie = build_entity_action_trie(entityActionList)
     # Event security file looks like this:
     # MANAGE_DEVICES=DEVICE.CREATE, DEVICE.DELETE
     for eventSecurityRow in eventSecurityPropertyFile:
@@ -65,6 +139,13 @@ def main():
     for tracerPropertyRow in tracerPropertyFile:
         tracerPropertyList = tracerPropertyRow.split("=")
         tracerPropertyKey = tracerPropertyList[0].strip(" ")
+        tracerEntityAction = parse_tracer_key(entityActionTrie,
+                                              tracerPropertyKey)
+        if tracerEntityAction is None:
+            if tracerPropertyKey:
+                print("No entity and action for tracer: ", tracerPropertyKey)
+            continue
+        (entity, action, severity) = tracerEntityAction
         tracerPropertyMessage = ("=".join(tracerPropertyList[1:])).strip(" ")
         # Replace or escape characters that are problematic for the wiki
         tracerPropertyMessage = re.sub("\{", "", tracerPropertyMessage)
@@ -81,39 +162,19 @@ def main():
 
         # for spellingMistake, correction in spellingMistakes.items():
         #     tracerPropertyMessage = tracerPropertyMessage.replace(spellingMistake, correction)
-        for (entity, action, entityAction) in entityActionList:
-            if entityAction in tracerPropertyKey:
-                # print("tracerPropertyKey: ", tracerPropertyKey)
-                # print("entity_action: ", entityAction)
-                entityPlusAction = entity + "." + action
-                if entityPlusAction in securityDict:
-                    privileges = ", ".join(securityDict[entityPlusAction])
-                for (severity, severityCode) in SEVERITY:
-                    # print("Looking for severity: ", severity)
-                    # Look for severity type (INFO, WARNING, ERROR)
-                    if severity in tracerPropertyKey:
-                        # print("severity: ", severity)
-                        tracerLine = "| " + entity + " | " + action + \
-                            " | " + severityCode + " | " + \
-                            tracerPropertyMessage + " | " + \
-                            privileges + " |\n"
-                        tracerList.append(tracerLine)
-    # Variable to check if new group for header row
-    lastEntity = " "
+        privileges = ", ".join(securityDict.get(entity + "." + action, []))
+        tracerRows.append((entity, action, severity,
+                           tracerPropertyMessage,
+                           privileges))
+    tracerRows.sort(key=get_tracer_sort_key)
+    wikiContent = "".join(iter_events_table(tracerRows))
+    # Save a copy of the table to check it before it is published
     with open(os.path.join(outputSubdir, wikiEventTracerFile), 'w') as f:
-        f.write(header)
-        sortedTracerList = sorted(tracerList)
-        for tracer in sortedTracerList:
-            tracerEntity = tracer.split("|")[1].strip()
-            if tracerEntity != lastEntity:
-                tracerHeaderLine = "||  h6. " + tracerEntity.replace("_", " ").capitalize() + " ||  ||  ||  ||  ||\n"
-                f.write(tracerHeaderLine)
-                lastEntity = tracerEntity[:]
-            f.write(tracer)
-
-    wikiContent = ""
-    with open(os.path.join(outputSubdir, wikiEventTracerFile), 'r') as f:
-        wikiContent = f.read()
+        f.write(wikiContent)
+    # Save the tracer fields for other scripts
+    with open(os.path.join(outputSubdir, jsonEventTracerFile), 'w') as f:
+        json.dump([dict(zip(TRACER_FIELDS, tracerRow))
+                   for tracerRow in tracerRows], f, indent=2)
 
     # Get user credentials and space
     site_URL = input("Confluence Cloud site URL, with protocol,"
@@ -126,9 +187,12 @@ def main():
     release_version = input("Release version, e.g. v463: ")
     print_version = input("Release print version, e.g. 4.6.3: ")
 
+    # Save the events of this release to compare with other releases
+    if release_version:
+        adb.save_release_rows(release_version, {"tracer_events": tracerRows})
+
     status = adt.updateWiki(updatePageTitle, wikiContent, wikiFormat,
                             site_URL, cloud_username, pwd, spacekey,
-                            tableReplaceString,
                             release_version, print_version, operation)
     if status is True:
         print("Page ", updatePageTitle,
@@ -8,42 +8,22 @@ import re
 import copy
 from datetime import datetime
 import os
-from abiquo.client import Abiquo
-from abiquo.auth import TokenAuth
 # from abiquo.client import check_response
+import abqplugintools as apt
+import abqhttpfixtures as ahf
 
 # For test environment disable SSL warning
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
-def getPlugins(api):
+def getPlugins(pluginCatalog):
     # Get plugins: hypervisor types, network devices,
     #              backup devices, draas devices
-    code, hypervisorTypesList = api.config.hypervisortypes.get(
-        headers={'Accept': 'application/vnd.abiquo.hypervisortypes+json'})
-    print("Get hypervisor types. Response code is: ", code)
-    hypervisorTypes = [ht["name"].lower()
-                       for ht in hypervisorTypesList.json["collection"]]
-
-    code, deviceTypesList = api.config.devicetypes.get(
-        headers={'Accept': 'application/vnd.abiquo.devicetypes+json'})
-    print("Get device types. Response code is: ", code)
-    deviceTypes = [dt["name"].lower()
-                   for dt in deviceTypesList.json["collection"]]
-
-    code, backupPluginTypesList = api.config.backupplugintypes.get(
-        headers={'Accept': 'application/vnd.abiquo.backupplugintypes+json'})
-    print("Get backup plugin types. Response code is: ", code)
-    backupPluginTypes = [bpt["type"].lower()
-                         for bpt in backupPluginTypesList.json["collection"]]
-
-    code, draasPluginTypesList = api.config.draasplugintypes.get(
-        headers={'Accept': 'application/vnd.abiquo.draasplugintypes+json'})
-    print("Get DRaaS device types. Response code is: ", code)
-    draasPluginTypes = [drpt["type"].lower()
-                        for drpt in draasPluginTypesList.json["collection"]]
-    return (hypervisorTypes, deviceTypes, backupPluginTypes, draasPluginTypes)
+    plugins = pluginCatalog["plugins"]
+    # Return new lists because main adds plugins
+    return (list(plugins["hypervisortypes"]), list(plugins["devicetypes"]),
+            list(plugins["backupplugintypes"]), list(plugins["draasplugintypes"]))
 
 
 def getDefault(pName, default):
@@ -371,11 +351,17 @@ def processGroups(propName, PLUGINS, METRICS, REMOTESERVICES):
 
 
 def main():
-    token = input("Enter token: ")
-    apiUrl = input("Enter API URL: ")
-    api = Abiquo(apiUrl, auth=TokenAuth(token), verify=False)
+    # Record or replay the HTTP responses, see abqhttpfixtures.py
+    ahf.setup_http_fixtures()
+    # Share the plugin catalog with process_properties_table.py
+    pluginCatalogFile = "output_files/abiquo_plugin_catalog.json"
+    pluginCatalogTtl = 7 * 24 * 60 * 60
+    pluginCatalogOffline = input("Use saved plugin catalog offline? (y/n): ") == "y"
+    pluginCatalog = apt.get_plugin_catalog(pluginCatalogFile,
+                                           pluginCatalogTtl,
+                                           pluginCatalogOffline)
     hypervisorTypes, deviceTypes, \
-        backupPluginTypes, draasPluginTypes = getPlugins(api)
+        backupPluginTypes, draasPluginTypes = getPlugins(pluginCatalog)
     for ht in hypervisorTypes:
         print("ht: ", ht)
     for dt in deviceTypes:
@@ -1,16 +1,22 @@
 #!/usr/bin/python3 -tt
 '''
 # This script formats the abiquo.properties file for documentation.
-# It creates a storage format version.
-# It is also possible to create a wiki markup version
+# It parses the file once and creates a storage format version,
+# a wiki markup version, a Markdown version and a JSON file
 #
 # The script requires:
 # - the Abiquo Python client installed with pip3
 # - access to the Abiquo API (input token and URL)
+#   or a saved plugin catalog (see abqplugintools.py)
 # - access to platform files (hardcoded location)
 # - mustache template file for storage format
 # - preformatted text file for abiquo.guest.password.length property
 #
+# To only update the storage format file from the cache of rendered rows:
+#   python3 process_properties_table.py --storage-only
+# To check the storage format of the descriptions in the fixture:
+#   python3 process_properties_table.py --check-fixture
+#
 # There are some values hardcoded in the functions:
 # - main
 # - fix_defaults
@@ -20,16 +26,20 @@
 
 
 import re
-import copy
 from datetime import datetime
 import os
+import sys
 import json
 import codecs
-from collections import Counter
-from pathlib import Path
-from abiquo.client import Abiquo
-from abiquo.auth import TokenAuth
+import hashlib
+import sqlite3
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import pystache
+import abqplugintools as apt
+import abqhttpfixtures as ahf
+import search_properties as sps
+import abqdocstore as adb
 
 
 # For test environment disable SSL warning
@@ -37,44 +47,31 @@ import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
-def get_plugins(api):
+class PropertyRecord(namedtuple("PropertyRecord",
+                                ["name", "sortName", "category", "profiles",
+                                 "default", "defaults", "description",
+                                 "validvalues", "usesMarkdown"])):
+    '''A parsed property that the pipeline stages share without copying.
+    # For a group of properties, e.g. by plugin, defaults is a tuple of
+    # (tag, default) pairs sorted by tag, otherwise it is empty.
+    # validvalues is None if the description has no "Valid values"'''
+    __slots__ = ()
+
+
+def get_plugins(plugin_catalog):
     '''Get plugins: hypervisor types, network devices,
                  backup devices, draas devices'''
-    code, hypervisor_types_list = api.config.hypervisortypes.get(
-        headers={'Accept': 'application/vnd.abiquo.hypervisortypes+json'})
-    print("Get hypervisor types. Response code is: ", code)
-    hypervisor_types = [ht["name"].lower()
-                       for ht in hypervisor_types_list.json["collection"]]
-
-    code, device_types_list = api.config.devicetypes.get(
-        headers={'Accept': 'application/vnd.abiquo.devicetypes+json'})
-    print("Get device types. Response code is: ", code)
-    device_types = [dt["name"].lower()
-                   for dt in device_types_list.json["collection"]]
-
-    code, backup_plugin_types_list = api.config.backupplugintypes.get(
-        headers={'Accept': 'application/vnd.abiquo.backupplugintypes+json'})
-    print("Get backup plugin types. Response code is: ", code)
-    backup_plugin_types = [bpt["type"].lower()
-                         for bpt in backup_plugin_types_list.json["collection"]]
-
-    code, draas_plugin_types_list = api.config.draasplugintypes.get(
-        headers={'Accept': 'application/vnd.abiquo.draasplugintypes+json'})
-    print("Get DRaaS device types. Response code is: ", code)
-    draas_plugin_types = [drpt["type"].lower()
-                        for drpt in draas_plugin_types_list.json["collection"]]
-    return (hypervisor_types, device_types, backup_plugin_types, draas_plugin_types)
+    plugins = plugin_catalog["plugins"]
+    # Return new lists because main adds and removes plugins
+    return (list(plugins["hypervisortypes"]), list(plugins["devicetypes"]),
+            list(plugins["backupplugintypes"]), list(plugins["draasplugintypes"]))
 
 
 def sort_for_output(properties_dict):
     ''' When sorting take into consideration sortName
     # For com.abiquo.foo.bar, sortname is abiquo.foo.bar'''
-    for p_name in properties_dict.keys():
-        if not properties_dict[p_name]["sortName"]:
-            properties_dict[p_name]["sortName"] = copy.deepcopy(
-                properties_dict[p_name]["property"])
     sorted_prop_dict = dict(sorted(properties_dict.items(),
-                                 key=lambda x: x[1]["sortName"].lower()))
+                                 key=lambda x: x[1].sortName.lower()))
     return sorted_prop_dict
 
 
@@ -104,18 +101,17 @@ def escape_wiki_markup_desc(description):
 
 def process_default_wiki(propv, newline, propv_default, 
                          plugin_blank_defaults, default_list):
-    '''Process property defaults including dict values'''
-    if isinstance(propv["default"], str):
-        if "http" in propv["default"] or ("{" or "[") in propv["default"]:
+    '''Process property defaults including group values'''
+    if not propv.defaults:
+        if "http" in propv.default or ("{" or "[") in propv.default:
             default_list = newline + "Default: {newcode}" + \
-                copy.deepcopy(propv["default"]) + "{newcode}"
+                propv.default + "{newcode}"
         else:
-            if re.search(r"\S+", propv["default"]):
-                default_list = newline + "_Default: " + copy.deepcopy(
-                    propv["default"]) + "_"
+            if re.search(r"\S+", propv.default):
+                default_list = newline + "_Default: " + propv.default + "_"
                 if "*" in default_list:
                     default_list = re.sub(r"\*", r"\\*", default_list)
-    if isinstance(propv["default"], dict):
+    else:
         value, count = Counter(
             propv_default.values()).most_common(1)[0]
         # Count the number of times the most common value occurs
@@ -153,11 +149,11 @@ def process_default_storage_format(propv, newline, propv_default,
                                    plugin_blank_defaults, 
                                    default_general_storage_format,
                                    default_plugins_storage_format):
-    '''Process property defaults including dict values'''
+    '''Process property defaults including group values'''
     default_plugins_storage_format = [] 
-    if isinstance(propv["default"], str):
-        default_general_storage_format = copy.deepcopy(propv["default"])
-    if isinstance(propv["default"], dict):
+    if not propv.defaults:
+        default_general_storage_format = propv.default
+    else:
         value, count = Counter(
             propv_default.values()).most_common(1)[0]
         # Count the number of times the most common value occurs
@@ -180,7 +176,7 @@ def process_default_storage_format(propv, newline, propv_default,
                         plugin_default = plugin + " = <code>" + defv + "</code>"
                         default_plugin_item = "<li>" + plugin_default + "</li>"
                         default_plugins_storage_format.append(
-                            {"plugindefault": copy.deepcopy(default_plugin_item)})
+                            {"plugindefault": default_plugin_item})
             if count == 1:
                 # If all properties have different defaults,
                 # then display them all
@@ -189,12 +185,12 @@ def process_default_storage_format(propv, newline, propv_default,
                     # A valid default is not empty or has an exemption
                     plugin_default = plugin + " = <code>" + defv +"</code>"
                     default_plugin_item = "<li>" + plugin_default + "</li>"
-                    default_plugins_storage_format.append({"plugindefault": copy.deepcopy(default_plugin_item)})
+                    default_plugins_storage_format.append({"plugindefault": default_plugin_item})
         if len(default_plugins_storage_format) > 0:
             default_plugins_list_start = "<ul>" + default_plugins_storage_format[0]["plugindefault"]
-            default_plugins_storage_format[0]["plugindefault"] = copy.deepcopy(default_plugins_list_start)
+            default_plugins_storage_format[0]["plugindefault"] = default_plugins_list_start
             default_plugins_list_end = default_plugins_storage_format[-1]["plugindefault"] + "</ul>"
-            default_plugins_storage_format[-1]["plugindefault"] = copy.deepcopy(default_plugins_list_end)
+            default_plugins_storage_format[-1]["plugindefault"] = default_plugins_list_end
         else:
             default_plugins_storage_format = ""
     return (default_general_storage_format, default_plugins_storage_format)
@@ -218,36 +214,33 @@ def prepare_for_wiki(pSDict, profile_columns,
         # else:
         #     anchor = ""
         # previousCategory = copy.deepcopy(propv["category"])
-        property_name = propv["property"]
+        property_name = propv.name
         property_name = escape_wiki_markup_name(property_name)
         pluginList = ""
-        if "default" in propv:
-            if type(propv["default"]) is dict:
-                propv_default = dict(sorted(propv["default"].items()))
-                for plugin in propv_default.keys():
-                    pluginList += newline + "\\- " + plugin
+        if propv.defaults:
+            propv_default = dict(propv.defaults)
+            for plugin in propv_default.keys():
+                pluginList += newline + "\\- " + plugin
         pTPD[pname]["Property"] = anchor + "*" + property_name + "* " + pluginList
 
         # Prepare the default entry
         default_list = ""
         # Note this is not correct but if anyone is using hyperv, let's
         # hope they know what they are doing
-        if "C:" in propv:
-            propv = re.sub("\\", "/", propv)
-        if "default" in propv:
-            default_list =  process_default_wiki(propv,  newline, 
-                propv_default, plugin_blank_defaults, default_list)
+        # if "C:" in propv.default:
+        #     propv = re.sub("\\", "/", propv)
+        default_list =  process_default_wiki(propv,  newline, 
+            propv_default, plugin_blank_defaults, default_list)
 
         # Prepare values
         valuesList = ""
-        if "validvalues" in propv:
+        if propv.validvalues is not None:
             valuesList = newline + "_Valid values: " + \
-                propv["validvalues"] + "_"
+                propv.validvalues + "_"
 
         # Prepare description
-        description = ""
-        if "description" in propv:
-            description = copy.deepcopy(propv["description"])
+        description = propv.description
+        if description:
             if "http" in description:
                 # put examples of nonexistent websites in code blocks
                 foundWebref = re.search(webrefs, description)
@@ -268,136 +261,263 @@ def prepare_for_wiki(pSDict, profile_columns,
             valuesList + default_list
 
         # Prepare profiles
-        if "profiles" in propv:
-            for profile in default_profiles:
-                pTPD[pname][profile] = " "
-            for profileName, profileImage in profile_images.items():
-                if profileName in propv["profiles"]:
-                    if profileName in profile_columns:
-                        column = profile_columns[profileName]
-                        pTPD[pname][column] = copy.deepcopy(
-                            profile_images[profileName])
+        for profile in default_profiles:
+            pTPD[pname][profile] = " "
+        for profileName, profileImage in profile_images.items():
+            if profileName in propv.profiles:
+                if profileName in profile_columns:
+                    column = profile_columns[profileName]
+                    pTPD[pname][column] = profileImage
     return pTPD
 
 
-def prepare_for_storage_format(pSDict, profile_columns, newline,
-                               webrefs, default_profiles,
-                               plugin_blank_defaults,
-                               profile_storage_format):
-    '''# Prepare a dict with the properties to document'''
-    pSFD = {}
+# Tokens of a description for the storage format, in order of preference.
+# A placeholder is <...> without spaces, e.g. <SERVER_IP_ADDRESS>.
+# A link goes from http: or https: to the next space
+DESCRIPTION_SCANNER = re.compile(r"""
+    (?P<space>\s+)
+    |(?P<link>https?:)
+    |(?P<placeholder><(?=\S*?>))
+    |(?P<lt><)
+    |(?P<gt>>)
+    |(?P<quotes>'+)
+    |(?P<brace>\{)
+    |(?P<text>[^\s<>'{h]+|h)
+    """, re.VERBOSE)
+
+
+def resolve_quotes(pieces):
+    '''Replace the runs of quotes in the pieces of a description with code
+    # tags. First pair the '' quotes, then pair the ' quotes that are left.
+    # A run of quotes is a number in pieces, the number of quotes'''
+    quotes = [(slot, offset) for slot, piece in enumerate(pieces)
+              if isinstance(piece, int) for offset in range(piece)]
+    tags = ["'"] * len(quotes)
+    opening = None
+    position = 0
+    while position + 1 < len(quotes):
+        if quotes[position][0] != quotes[position + 1][0]:
+            position += 1
+            continue
+        # Two quotes in the same run, e.g. ''code''
+        if opening is None:
+            opening = position
+        else:
+            tags[opening:opening + 2] = ["<code>", ""]
+            tags[position:position + 2] = ["</code>", ""]
+            opening = None
+        position += 2
+    # The quotes that are not in pairs of '' make pairs of '
+    single_quotes = [position for position, tag in enumerate(tags)
+                     if tag == "'"]
+    for open_quote, close_quote in zip(single_quotes[0::2],
+                                       single_quotes[1::2]):
+        tags[open_quote] = "<code>"
+        tags[close_quote] = "</code>"
+    resolved = []
+    quote_tags = iter(tags)
+    for piece in pieces:
+        if isinstance(piece, int):
+            resolved.extend(next(quote_tags) for _ in range(piece))
+        else:
+            resolved.append(piece)
+    return resolved
+
+
+def format_description_storage_format(description, webrefs_search):
+    '''Format a description for the storage format in one scan:
+    # - placeholders, e.g. <SERVER_IP_ADDRESS> become {$SERVER_IP_ADDRESS}
+    # - other angle brackets are escaped
+    # - links become code if there are example websites (webrefs)
+    #   or placeholders or braces, otherwise they are links
+    # - text between '' or ' quotes becomes code'''
+    pieces = []
+    links = []
+    link_start = None
+    in_placeholder = False
+    has_brace = False
+    position = 0
+    while position < len(description):
+        token = DESCRIPTION_SCANNER.match(description, position)
+        kind = token.lastgroup
+        position = token.end()
+        if kind == "space":
+            if link_start is not None:
+                links.append((link_start, len(pieces)))
+                link_start = None
+            pieces.append(token.group())
+        elif kind == "link":
+            if link_start is None:
+                link_start = len(pieces)
+            pieces.append(token.group())
+        elif kind == "placeholder" and not in_placeholder:
+            in_placeholder = True
+            has_brace = True
+            pieces.append("{$")
+        elif kind in ("placeholder", "lt"):
+            pieces.append("\\<")
+        elif kind == "gt":
+            pieces.append("}" if in_placeholder else "\\>")
+            in_placeholder = False
+        elif kind == "quotes":
+            pieces.append(len(token.group()))
+        else:
+            has_brace = has_brace or kind == "brace"
+            pieces.append(token.group())
+    if link_start is not None:
+        links.append((link_start, len(pieces)))
+
+    if links:
+        # Put examples of nonexistent websites in code blocks
+        as_code = has_brace or webrefs_search.search(description)
+        linked = []
+        linked_end = 0
+        for start, end in links:
+            linked.extend(pieces[linked_end:start])
+            if as_code:
+                linked.append("<code>")
+                linked.extend(pieces[start:end])
+                linked.append("</code>")
+            else:
+                linked.append('<a href="')
+                linked.extend(pieces[start:end])
+                linked.append('">')
+                linked.extend(pieces[start:end])
+                linked.append("</a>")
+            linked_end = end
+        linked.extend(pieces[linked_end:])
+        pieces = linked
+    if "'" in description:
+        pieces = resolve_quotes(pieces)
+    return "".join(pieces)
+
+
+# Descriptions with the storage format of the chain of substitutions
+# that the scanner replaced. Check them with --check-fixture
+CHECK_FIXTURE_OPTION = "--check-fixture"
+DESCRIPTION_FIXTURE = "input_files/description_fixture.json"
+
+
+def check_description_fixture():
+    '''Compare the storage format of the fixture descriptions
+    # with the expected storage format'''
+    with open(DESCRIPTION_FIXTURE, "r") as fixture_file:
+        fixture = json.load(fixture_file)
+    webrefs_search = re.compile(webrefs)
+    mismatches = 0
+    for fixture_entry in fixture:
+        storage_format = format_description_storage_format(
+            fixture_entry["description"], webrefs_search)
+        if storage_format != fixture_entry["storage_format"]:
+            mismatches += 1
+            print("Description: ", fixture_entry["description"])
+            print("   Expected: ", fixture_entry["storage_format"])
+            print("        Got: ", storage_format)
+    if mismatches:
+        print("Descriptions not in the expected storage format: ", mismatches)
+        sys.exit(1)
+    print("The storage format of the fixture descriptions is as expected: ",
+          len(fixture))
+
+
+def iter_row_colors(categories):
+    '''Get the highlight colour of each row, which changes
+    # when the category is different from the row before'''
     previousCategory = ""
-    anchor = ""
-    propv_default = {}
     prop_color = "#ffffff"
-    print(len(pSDict))
-    for pname, propv in pSDict.items():
-        pSFD[pname] = {}
-        # Prepare the Property entry
-        plugin_list = []
-        # if propv["category"] != previousCategory:
-        #     anchor = " {anchor: " + copy.deepcopy(propv["category"]) + "} "
-        # else:
-        #     anchor = ""
-        # previousCategory = copy.deepcopy(propv["category"])
-        if propv["category"] != previousCategory:
+    for category in categories:
+        if category != previousCategory:
             if prop_color == '\"#e6fcff\"':
                 prop_color = '\"#ffffff\"'
             else:
                 prop_color = '\"#e6fcff\"'
-        previousCategory = copy.deepcopy(propv["category"])
-        property_name = propv["property"]
-        # property_name = escape_wiki_markup_name(property_name)
-        plugin_list = []
-        ## make a list of plugin names under the property itself ##
-        if "default" in propv:
-            if isinstance(propv["default"], dict):
-                propv_default = dict(sorted(propv["default"].items()))
-                for plugin in propv_default.keys():
-                    plugin_list.append("<li>" + plugin + "</li>")
-                plugin_list_start = "<ul>" + plugin_list[0]
-                plugin_list[0] = copy.deepcopy(plugin_list_start)
-                plugin_list_end = plugin_list[-1] + "</ul>"
-                plugin_list[-1] = copy.deepcopy(plugin_list_end)  
-        pSFD[pname]["property"] = anchor + "<strong>" + property_name + "</strong>" 
-        pSFD[pname]["propcolor"] = prop_color[:]
-        if len(plugin_list) > 0:
-            pSFD[pname]["pluginlist"] = [] 
-            for plugin_item in plugin_list: 
-                pSFD[pname]["pluginlist"].append({"plugin": plugin_item})
-        else:
-            pSFD[pname]["pluginlist"] = ""
-        # Prepare the default entry
-        default_general_storage_format = ""
-        default_plugins_storage_format = []
-        default_general_storage_format, default_plugins_storage_format = \
-            process_default_storage_format(propv, newline, 
-                                           propv_default, plugin_blank_defaults, 
-                                           default_general_storage_format,
-                                           default_plugins_storage_format)
+        previousCategory = category
+        yield prop_color
 
-        # Prepare description
-        description = ""
-        if "description" in propv:
-            # print("propv[desc] ", propv["description"])
-            description = copy.deepcopy(propv["description"])
-        if "description" in propv and "usesMarkdown" not in propv:
-            # print("description: ", description)
-            if "<" in description:
-                description = re.sub(r"<((\S)*?)>",r'{$\1}',description)
-                # print ("desc no <: ", description)
-            if "<" in description:
-                description = re.sub(r"<",r"\<",description)
-            if ">" in description:
-                description = re.sub(r">",r"\>",description)
-            if "http" in description:
-                # put examples of nonexistent websites in code blocks
-                found_web_ref = re.search(webrefs, description)
-                if found_web_ref or r"{" in description:
-                    print("DESCRIPTION: ", description)
-                    description = re.sub(r"((http:|https:)(\S*)?)",
-                                         r'<code>\1</code>',
-                                         description)
-                else:
-                    # Process links
-                    description = re.sub(r"((http:|https:)(\S*)?)",
-                                         r'<a href="\1">\1</a>',
-                                         description)
 
-            if "\'\'" in description:
-                # print("found a quote, which can contain spaces")
-                # print(description)
-                description = re.sub(r"\'\'(([\S\s])*?)\'\'", r"<code>\1</code>",
-                                     description)
-                # print("description without quotes: " description)
-                # description = escape_wiki_markup_desc(description)
-            if "\'" in description:
-                description = re.sub(r"\'(([\S\s])*?)\'", r"<code>\1</code>",
-                                     description)
-        pSFD[pname]["description"] = copy.deepcopy(description)
-       
-        pSFD[pname]["validvalues"] = []
-        if "validvalues" in propv:
-            valid_value_dict = {"validvalue": propv["validvalues"]}
-            pSFD[pname]["validvalues"].append(valid_value_dict)
-        else:
-            pSFD[pname]["validvalues"] = ""
+def prepare_storage_format_entry(propv, prop_color, profile_columns, newline,
+                                 webrefs_search, default_profiles,
+                                 plugin_blank_defaults,
+                                 profile_storage_format):
+    '''# Prepare the entry of one property to document'''
+    pSFE = {}
+    anchor = ""
+    propv_default = {}
+    # Prepare the Property entry
+    property_name = propv.name
+    # property_name = escape_wiki_markup_name(property_name)
+    plugin_list = []
+    ## make a list of plugin names under the property itself ##
+    if propv.defaults:
+        propv_default = dict(propv.defaults)
+        for plugin in propv_default.keys():
+            plugin_list.append("<li>" + plugin + "</li>")
+        plugin_list[0] = "<ul>" + plugin_list[0]
+        plugin_list[-1] = plugin_list[-1] + "</ul>"
+    pSFE["property"] = anchor + "<strong>" + property_name + "</strong>" 
+    pSFE["propcolor"] = prop_color[:]
+    if len(plugin_list) > 0:
+        pSFE["pluginlist"] = [] 
+        for plugin_item in plugin_list: 
+            pSFE["pluginlist"].append({"plugin": plugin_item})
+    else:
+        pSFE["pluginlist"] = ""
+    # Prepare the default entry
+    default_general_storage_format = ""
+    default_plugins_storage_format = []
+    default_general_storage_format, default_plugins_storage_format = \
+        process_default_storage_format(propv, newline, 
+                                       propv_default, plugin_blank_defaults, 
+                                       default_general_storage_format,
+                                       default_plugins_storage_format)
+
+    # Prepare description
+    description = propv.description
+    if not propv.usesMarkdown:
+        description = format_description_storage_format(description,
+                                                         webrefs_search)
+    pSFE["description"] = description
+   
+    pSFE["validvalues"] = []
+    if propv.validvalues is not None:
+        valid_value_dict = {"validvalue": propv.validvalues}
+        pSFE["validvalues"].append(valid_value_dict)
+    else:
+        pSFE["validvalues"] = ""
 
-        pSFD[pname]["maindefault"] = copy.deepcopy(default_general_storage_format)
-        if len(default_plugins_storage_format) > 0:
-            pSFD[pname]["defaultlist"] = default_plugins_storage_format[:]
-        else:
-            pSFD[pname]["defaultlist"] = ""
-        # Prepare profiles
-        if "profiles" in propv:
-            for profile in default_profiles:
-                pSFD[pname][profile] = ""
-            for profile_name in profile_storage_format.keys():
-                if profile_name in propv["profiles"]:
-                    if profile_name in profile_columns:
-                        column = profile_columns[profile_name]
-                        pSFD[pname][column] = copy.deepcopy(
-                            profile_storage_format[profile_name])
+    pSFE["maindefault"] = default_general_storage_format
+    if len(default_plugins_storage_format) > 0:
+        pSFE["defaultlist"] = default_plugins_storage_format[:]
+    else:
+        pSFE["defaultlist"] = ""
+    # Prepare profiles
+    for profile in default_profiles:
+        pSFE[profile] = ""
+    for profile_name, profile_label in profile_storage_format.items():
+        if profile_name in propv.profiles:
+            if profile_name in profile_columns:
+                column = profile_columns[profile_name]
+                pSFE[column] = profile_label
+    return pSFE
+
+
+def prepare_for_storage_format(pSDict, profile_columns, newline,
+                               webrefs, default_profiles,
+                               plugin_blank_defaults,
+                               profile_storage_format):
+    '''# Prepare a dict with the properties to document'''
+    pSFD = {}
+    webrefs_search = re.compile(webrefs)
+    print(len(pSDict))
+    # if propv["category"] != previousCategory:
+    #     anchor = " {anchor: " + copy.deepcopy(propv["category"]) + "} "
+    # else:
+    #     anchor = ""
+    row_colors = iter_row_colors(propv.category for propv in pSDict.values())
+    for (pname, propv), prop_color in zip(pSDict.items(), row_colors):
+        pSFD[pname] = prepare_storage_format_entry(
+            propv, prop_color, profile_columns, newline, webrefs_search,
+            default_profiles, plugin_blank_defaults, profile_storage_format)
     print("Number of properties: ", len(pSFD))
     return pSFD
 
@@ -435,7 +555,7 @@ def get_category(prop_name, category_dict):
             property_cat = prop_cat[0][:]
 
     if property_cat in category_dict:
-        return (copy.deepcopy(category_dict[property_cat]), prop_sort_name)
+        return (category_dict[property_cat], prop_sort_name)
     return property_cat, prop_sort_name
 
 
@@ -456,68 +576,62 @@ def get_prop_name_default(currentProp):
     return property_name, propDefault
 
 
-def processGroup(propList, group_types):
+def build_group_index(group_types):
+    '''Build a reverse index from a name component, e.g. "amazon",
+    # to its group type, e.g. "{plugin}". Do this once per run'''
+    group_index = {}
+    for group, groupList in group_types.items():
+        for tag in groupList:
+            group_index.setdefault(tag, group)
+    return group_index
+
+
+def get_group_tag(property_name, group_index):
+    '''Find the first name component that is a plugin, metric, etc.
+    # Return the group name abiquo.foo.{tagType}.bar and the tag'''
+    property_nameList = property_name.strip().split(".")
+    # plugins etc are not in first two parts of name
+    for position in range(2, len(property_nameList)):
+        group = group_index.get(property_nameList[position])
+        if group:
+            tag = property_nameList[position]
+            property_nameList[position] = group
+            return ".".join(property_nameList), tag
+    return "", ""
+
+
+def processGroup(propList, group_index):
     # For properties that are in groups e.g. by plugins, metrics
     # Return group name and array of tags (e.g. "amazon") and defaults
-    groupWorkList = []
-    groupList = []
-    groupTagList = []
-    propDefDict = {}
     propGroupDefDict = {}
     grouprop_name = ""
-    myGroup = ""
 
     for prop in propList:
         if "--" not in prop:
             property_name, propDefault = get_prop_name_default(prop)
-            propDefDict[property_name] = propDefault
-
-    for property_name in propDefDict:
-        property_name.strip()
-        property_nameList = property_name.split(".")
-        # plugins etc are not in first two parts of name
-        # filter list of plugins in each list
-        # last_prop_nameList = property_nameList[2:]
-        groupWorkList.extend(property_nameList[2:])
-    reducedSet = set(groupWorkList)
-    reducedList = list(reducedSet)
+            group_name, tag = get_group_tag(property_name, group_index)
+            if tag:
+                propGroupDefDict[tag] = propDefault
+                if not grouprop_name:
+                    grouprop_name = group_name
 
-    for group, groupList in group_types.items():
-        for x in reducedList:
-            if x in groupList:
-                groupTagList.append(x)
-                myGroup = copy.deepcopy(group)
-
-    if len(groupTagList) > 0:
-        # Create a grouprop_name, which is abiquo.foo.{tagType}.bar
-        # Store tags in an array
-        for tag in groupTagList:
-            for name, default in propDefDict.items():
-                if tag in name:
-                    propGroupDefDict[tag] = default
-                    if not grouprop_name:
-                        grouprop_name = name.replace(tag, myGroup)
-        return grouprop_name, propGroupDefDict
-    return "", ""
+    if len(propGroupDefDict) > 0:
+        return grouprop_name, tuple(sorted(propGroupDefDict.items()))
+    return "", ()
 
 
-def get_property_values(propertyList, propertyDict,
-                      group_types, category_dict):
+def get_property_values(propertyList, group_index, category_dict):
     # For a property, get:
     # - Names, including group names with plugin or metric, etc.
     # - Names for sorting (e.g. no "com."),
     # - Categories (for anchors)
-    # - and default values, which can be strings or arrays
+    # - and default values, which can be strings or (tag, default) pairs
     initial_prop_name, propDefault = get_prop_name_default(propertyList[0])
-    propertyDict["category"], propertyDict["sortName"] = get_category(
-        initial_prop_name, category_dict)
+    category, sortName = get_category(initial_prop_name, category_dict)
     if len(propertyList) == 1:
-        propertyDict["property"] = initial_prop_name
-        propertyDict["default"] = propDefault
-    else:
-        propertyDict["property"], propertyDict["default"] = processGroup(
-            propertyList, group_types)
-    return(propertyDict)
+        return (initial_prop_name, sortName, category, propDefault, ())
+    property_name, defaults = processGroup(propertyList, group_index)
+    return (property_name, sortName, category, "", defaults)
 
 
 def process_comment(commentList, newline, 
@@ -554,46 +668,219 @@ def process_valid(description):
     return(new_description, valid_values)
 
 
-def writeStorageFormatFile(properties_storage_format_dict, output_subdir, 
-                           properties_sf_file, deprecated_to_remove, 
-                           properties_test_file):
-
+class CompiledTemplate(namedtuple("CompiledTemplate",
+                                  ["mtime", "hash", "parsed", "head",
+                                   "row", "tail"])):
+    '''A mustache template parsed once, with the rows of a section
+    # parsed separately so that they can be rendered one at a time'''
+    __slots__ = ()
+
+
+# Compiled templates by file name, so each template is only parsed once
+compiled_templates = {}
+
+
+def split_mustache_section(mustache_template, section):
+    '''Split a template around a section, e.g. {{#propertyentries}}
+    # Return the text before the section, the row template and the text after'''
+    section_start = "{{#" + section + "}}"
+    section_end = "{{/" + section + "}}"
+    head, rest = mustache_template.split(section_start, 1)
+    row_template, tail = rest.split(section_end, 1)
+    return head, row_template, tail
+
+
+def get_compiled_template(template_file, section):
+    '''Get the compiled template for the file, and only parse the
+    # template again if the file has changed (new mtime and hash)'''
+    template_mtime = os.stat(template_file).st_mtime
+    compiled = compiled_templates.get(template_file)
+    if compiled and compiled.mtime == template_mtime:
+        return compiled
+    mustache_template = codecs.open(template_file, 'r', 'utf-8').read()
+    template_hash = hashlib.sha256(
+        mustache_template.encode("utf-8")).hexdigest()
+    if compiled and compiled.hash == template_hash:
+        compiled = compiled._replace(mtime=template_mtime)
+    else:
+        head, row_template, tail = split_mustache_section(mustache_template,
+                                                          section)
+        compiled = CompiledTemplate(template_mtime, template_hash,
+                                    pystache.parse(mustache_template),
+                                    head, pystache.parse(row_template), tail)
+    compiled_templates[template_file] = compiled
+    return compiled
+
+
+def iter_rendered_rows(compiled, properties_entries):
+    '''Render the table rows one at a time'''
+    renderer = pystache.Renderer()
+    for property_entry in properties_entries:
+        yield renderer.render(compiled.row, property_entry)
+
+
+def compile_deprecation_matcher(deprecated_to_remove):
+    '''Combine the patterns of deprecated properties into one regex'''
+    if not deprecated_to_remove:
+        return None
+    return re.compile("|".join("(?:" + pluginDeprecated + ")"
+                               for pluginDeprecated in deprecated_to_remove))
+
+
+def iter_properties_to_document(properties_dict, deprecated_to_remove):
+    '''Yield each property that is not deprecated, and only once.
+    # Used by the wiki markup and storage format writers'''
+    deprecation_matcher = compile_deprecation_matcher(deprecated_to_remove)
+    seen_entries = set()
+    for prop_name, prop_entry in properties_dict.items():
+        if deprecation_matcher and deprecation_matcher.search(prop_name):
+            continue
+        entry_key = hashlib.sha1(json.dumps(
+            prop_entry, sort_keys=True).encode("utf-8")).digest()
+        if entry_key in seen_entries:
+            continue
+        seen_entries.add(entry_key)
+        yield prop_name, prop_entry
+
+
+def writeStorageFormatFile(properties_storage_format_dict, output_subdir,
+                           properties_sf_file, deprecated_to_remove,
+                           properties_test_file, stream=True):
+    '''Render the properties table with the mustache template.
+    # In stream mode, write each row to the file as soon as it is rendered'''
     properties_mustache_dict = {}
     # add pystache stuff
     # property_mustache_keys = ["property", "pluginlist", "description", "validvalues", "SERVER", "rss", "v2v", "oba"]
-    properties_entries = []
-
-    for propToSF in properties_storage_format_dict.values():
-        for pluginDeprecated in deprecated_to_remove:
-            if not re.search(pluginDeprecated, propToSF["property"]):
-                # print (" | ".join(propToSF.values()))
-                # prop_line_for_storage_format = dict(zip(property_mustache_keys, propToSF.values()))
-                # print("propToSF: ", str(propToSF)) 
-                if propToSF not in properties_entries: 
-                    properties_entries.append(propToSF)
+    properties_entries = [propToSF for _, propToSF in
+                          iter_properties_to_document(
+                              properties_storage_format_dict,
+                              deprecated_to_remove)]
 
-    properties_mustache_dict = {"propertyentries": properties_entries[:]}
+    compiled = get_compiled_template("wiki_properties_template.mustache",
+                                     "propertyentries")
 
     with open(os.path.join(output_subdir, properties_sf_file), 'w') as ef:
         with open(os.path.join(output_subdir, properties_test_file), 'w') as ofile:
-            for cpr in properties_mustache_dict["propertyentries"]:
+            for cpr in properties_entries:
                 ofile.write(json.dumps(cpr))
-            # do the mustache render
-            # mustache_template = codecs.open("wiki_privileges_template_"
-            #     + td + ".mustache", 'r', 'utf-8').read()
-            mustache_template = codecs.open("wiki_properties_template.mustache",
-                                       'r', 'utf-8').read()
-            # mustache_template = open("wiki_privileges_template.mustache", "r").read()
-            #    efo = pystache.render(mustache_template, privilege_out).encode('utf-8',
-            #        'xmlcharrefreplace')
-            efo = pystache.render(mustache_template, properties_mustache_dict)
-            # efo = pystache.render(mustache_template, privilege_out)
-
-            ef.write(efo)
-            ef.close()
+        # do the mustache render
+        if stream:
+            ef.write(compiled.head)
+            for row in iter_rendered_rows(compiled, properties_entries):
+                ef.write(row)
+            ef.write(compiled.tail)
+        else:
+            properties_mustache_dict = {"propertyentries": properties_entries}
+            ef.write(pystache.Renderer().render(compiled.parsed,
+                                                properties_mustache_dict))
     return True
 
 
+# Block types yielded by tokenize_properties_file
+PROFILE_BLOCK = "profile"
+PROPERTY_BLOCK = "property"
+COMMENT_BLOCK = "comment"
+SEPARATOR_BLOCK = "separator"
+
+
+def compile_properties_lexer(propSearchString, PLUGIN_SEPARATOR):
+    '''Compile one lexer for all the lines of the properties file.
+    # A line is a profile header "########## SERVER", a property,
+    # a plugin separator "#-- vmware" or a comment, in that order'''
+    return re.compile(r"(?P<profile>.*#{10})"
+                      r"|(?P<property>" + propSearchString + r")"
+                      r"|(?P<separator>.*" + re.escape(PLUGIN_SEPARATOR) + r")"
+                      r"|(?P<comment>)")
+
+
+def get_block_profiles(block_lines, profile_spaces):
+    '''Get the profile names from a profile section header block'''
+    roughProfile = "\n".join(block_lines)
+    for profileNoSpaces, profileSpaces in profile_spaces.items():
+        if profileSpaces in roughProfile:
+            roughProfile = roughProfile.replace(profileSpaces,
+                                                profileNoSpaces)
+    return re.findall(r"[A-Z,1-9]+", roughProfile)
+
+
+def tokenize_block(block_lines, lexer, profile_spaces):
+    '''Sort the lines of one block by type and return a typed block'''
+    propertyList = []
+    commentList = []
+    separatorList = []
+    for block_line in block_lines:
+        line_type = lexer.match(block_line).lastgroup
+        if line_type == "profile":
+            # A profile section header "########## REMOTESERVICES" etc
+            return (PROFILE_BLOCK,
+                    get_block_profiles(block_lines, profile_spaces))
+        if line_type == "property":
+            propertyList.append(block_line)
+        elif line_type == "separator":
+            # Note here we could store plugin type
+            # And use in documentation
+            separatorList.append(block_line)
+        else:
+            commentList.append(block_line)
+    if propertyList:
+        return (PROPERTY_BLOCK, (propertyList, commentList))
+    if separatorList and not commentList:
+        return (SEPARATOR_BLOCK, separatorList)
+    return (COMMENT_BLOCK, commentList)
+
+
+def iter_file_blocks(input_path):
+    '''Read the properties file one line at a time and yield the lines
+    # of each block. Blocks are separated by empty lines,
+    # so only one block is in memory'''
+    block_lines = []
+    with open(input_path, "r") as properties_file:
+        for line in properties_file:
+            line = line.rstrip("\n")
+            if line:
+                block_lines.append(line)
+            elif block_lines:
+                yield block_lines
+                block_lines = []
+    if block_lines:
+        yield block_lines
+
+
+def tokenize_properties_file(input_path, lexer, profile_spaces):
+    '''Read the properties file and yield typed blocks'''
+    for block_lines in iter_file_blocks(input_path):
+        yield tokenize_block(block_lines, lexer, profile_spaces)
+
+
+def parse_property_block(block, currentProfiles, group_index,
+                         category_dict, newline, markdown_properties,
+                         list_of_dead_properties,
+                         process_properties_formatted):
+    '''Get the PropertyRecord of a property block,
+    # or None if it is a dead property'''
+    propertyList, commentList = block
+    # This can be useful for debugging :-)
+    # print("CL: ", commentList)
+    # print("PL: ", propertyList)
+    prop_name, sortName, category, default, defaults = \
+        get_property_values(propertyList,
+                            group_index, category_dict)
+    if prop_name in list_of_dead_properties:
+        print("temp_prop_name: ", prop_name)
+        return None
+    usesMarkdown = prop_name in markdown_properties
+    description = process_comment(commentList,
+                                  newline,
+                                  usesMarkdown,
+                                  process_properties_formatted)
+    validvalues = None
+    if "Valid values" in description:
+        description, validvalues = process_valid(description)
+    return PropertyRecord(prop_name, sortName or prop_name, category,
+                          tuple(currentProfiles), default, defaults,
+                          description, validvalues, usesMarkdown)
+
+
 def readFileGetProperties(input_dir, propertyFile,
                           profile_spaces,
                           propertySearchString,
@@ -606,69 +893,26 @@ def readFileGetProperties(input_dir, propertyFile,
                           list_of_dead_properties,
                           process_properties_formatted):
     '''Read the input file and get the properties'''
-    inputText = Path(os.path.join(input_dir, propertyFile)).read_text()
-    textList = inputText.split("\n\n")
+    lexer = compile_properties_lexer(propSearchString, PLUGIN_SEPARATOR)
+    group_index = build_group_index(group_types)
     currentProfiles = []
     propertiesDict = {}
-    for text in textList:
-        # If it's a profile section header "########## REMOTESERVICES" etc
-        if re.search(r"#{10}", text):
-            roughProfile = copy.deepcopy(text)
-            for profileNoSpaces, profileSpaces in profile_spaces.items():
-                if profileSpaces in roughProfile:
-                    roughProfile = roughProfile.replace(profileSpaces,
-                                                        profileNoSpaces)
-            currentProfiles = re.findall(r"[A-Z,1-9]+", roughProfile)
-
-        # If it contains a property
-        else:
-            propertyDict = {}
-            commentList = []
-            propertyList = []
-            property_lines_list = text.split("\n")
-            for property_line in property_lines_list:
-                if re.match(propSearchString, property_line):
-                    propertyList.append(property_line)
-                elif PLUGIN_SEPARATOR in property_line:
-                    continue
-                    # Note here we could store plugin type
-                    # And use in documentation
-                else:
-                    commentList.append(property_line)
-            # This can be useful for debugging :-)
-            # print("CL: ", commentList)
-            # print("PL: ", propertyList)
-            if len(propertyList) >= 1:
-                propertyDict = get_property_values(
-                    propertyList, propertyDict,
-                    group_types, category_dict)
-                propertyDict["profiles"] = currentProfiles[:]
-                usesMarkdown = False
-                for markdownProp in markdown_properties:
-                    if markdownProp == propertyDict["property"]:
-                        usesMarkdown = True
-                        propertyDict["usesMarkdown"] = True
-                propertyDict["description"] = \
-                    process_comment(commentList,
-                                   newline,
-                                   usesMarkdown,
-                                   process_properties_formatted)
-                if "Valid values" in propertyDict["description"]:
-                    propertyDict["description"], propertyDict[
-                        "validvalues"] = process_valid(
-                        propertyDict["description"])
-
-                temp_prop_name = copy.deepcopy(propertyDict["property"])
-                if temp_prop_name not in list_of_dead_properties:
-                    propertiesDict[temp_prop_name] = copy.deepcopy(propertyDict)
-                else:
-                    print("temp_prop_name: ", temp_prop_name)
-            else:
-                # This is the comment at the start of the file,
-                # which doesn't contain any valid properties,
-                # or at least it didn't
-                continue
-    return(copy.deepcopy(propertiesDict))
+    for block_type, block in tokenize_properties_file(
+            os.path.join(input_dir, propertyFile), lexer, profile_spaces):
+        if block_type == PROFILE_BLOCK:
+            currentProfiles = block
+        elif block_type == PROPERTY_BLOCK:
+            propv = parse_property_block(block, currentProfiles,
+                                         group_index, category_dict,
+                                         newline, markdown_properties,
+                                         list_of_dead_properties,
+                                         process_properties_formatted)
+            if propv is not None:
+                propertiesDict[propv.name] = propv
+        # Otherwise it is the comment at the start of the file,
+        # which doesn't contain any valid properties,
+        # or at least it didn't, or a block of plugin separators
+    return propertiesDict
 
 
     check_storage_format = writeStorageFormatFile(properties_storage_format_dict, 
@@ -678,6 +922,173 @@ def readFileGetProperties(input_dir, propertyFile,
                                                   properties_test_sf_file) 
 
 
+# Increase this if the parsing or the storage format of the rows changes
+BLOCK_CACHE_VERSION = 1
+
+BLOCK_CACHE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blocks (
+    key TEXT PRIMARY KEY, name TEXT, sort_name TEXT, category TEXT,
+    row TEXT);
+'''
+
+# Rows are cached with this instead of the highlight colour,
+# because the colour depends on the category of the row before
+ROW_COLOR_PLACEHOLDER = "\x00propcolor\x00"
+
+
+def get_block_cache_salt(template_hash, output_config):
+    '''Hash what changes a row apart from its block: the template,
+    # the plugin and metric groups from the plugin catalog, and the settings'''
+    formatted_text = ""
+    if os.path.exists(process_properties_formatted):
+        with open(process_properties_formatted, "r") as formatted_file:
+            formatted_text = formatted_file.read()
+    settings = [BLOCK_CACHE_VERSION, output_config["group_types"],
+                propSearchString, PLUGIN_SEPARATOR, profile_spaces,
+                category_dict, newline, markdown_properties,
+                list_of_dead_properties, formatted_text]
+    settings += [output_config[setting] for setting in
+                 ["newline_storage_format", "webrefs", "default_profiles",
+                  "profile_columns", "profile_storage_format",
+                  "plugin_blank_defaults"]]
+    settings_hash = hashlib.sha256(json.dumps(
+        settings, sort_keys=True).encode("utf-8")).hexdigest()
+    return template_hash + settings_hash
+
+
+def get_block_key(salt, profiles, block_lines):
+    '''Hash the raw text of a block and the profiles it is under'''
+    return hashlib.sha256("\n".join(
+        [salt, " ".join(profiles)] + block_lines).encode("utf-8")).hexdigest()
+
+
+def is_profile_block(block_lines):
+    '''Check for a profile header "########## SERVER" like the lexer'''
+    return any("#" * 10 in block_line for block_line in block_lines)
+
+
+def open_block_cache(block_cache_path):
+    '''Open the cache of rendered rows by block and create it if needed'''
+    connection = sqlite3.connect(block_cache_path)
+    connection.executescript(BLOCK_CACHE_SCHEMA)
+    return connection
+
+
+def save_block_cache(block_cache, new_blocks, used_keys, max_cached_blocks):
+    '''Add the new blocks to the cache without touching the others.
+    # Evict the oldest blocks that are not in the file to keep it small'''
+    with block_cache:
+        block_cache.executemany(
+            "INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?)",
+            new_blocks)
+        cached_blocks = block_cache.execute(
+            "SELECT count(*) FROM blocks").fetchone()[0]
+        if cached_blocks > max_cached_blocks:
+            block_cache.execute(
+                "CREATE TEMP TABLE used_keys (key TEXT PRIMARY KEY)")
+            block_cache.executemany(
+                "INSERT OR IGNORE INTO used_keys VALUES (?)",
+                ((block_key,) for block_key in used_keys))
+            block_cache.execute(
+                "DELETE FROM blocks WHERE rowid IN (SELECT rowid FROM blocks"
+                " WHERE key NOT IN (SELECT key FROM used_keys)"
+                " ORDER BY rowid LIMIT ?)",
+                (cached_blocks - max_cached_blocks,))
+
+
+def render_property_block(block_lines, profiles, compiled, lexer,
+                          group_index, webrefs_search, output_config):
+    '''Parse, prepare and render a block that is not in the cache.
+    # Return (name, sort name, category, row), or all None if the block
+    # is not a property or is a dead property'''
+    block_type, block = tokenize_block(block_lines, lexer, profile_spaces)
+    propv = None
+    if block_type == PROPERTY_BLOCK:
+        propv = parse_property_block(block, profiles, group_index,
+                                     category_dict, newline,
+                                     markdown_properties,
+                                     list_of_dead_properties,
+                                     process_properties_formatted)
+    if propv is None:
+        return (None, None, None, None)
+    property_entry = prepare_storage_format_entry(
+        propv, ROW_COLOR_PLACEHOLDER, output_config["profile_columns"],
+        output_config["newline_storage_format"], webrefs_search,
+        output_config["default_profiles"],
+        output_config["plugin_blank_defaults"],
+        output_config["profile_storage_format"])
+    return (propv.name, propv.sortName, propv.category,
+            pystache.Renderer().render(compiled.row, property_entry))
+
+
+def read_storage_format_rows(block_cache, compiled, output_config):
+    '''Get the rows of the properties table from the blocks of the file.
+    # Only parse, prepare and render the blocks that are not in the cache.
+    # Return the rows by property name as (sort name, category, row),
+    # the keys of the blocks in the file and the new cache entries'''
+    salt = get_block_cache_salt(compiled.hash, output_config)
+    lexer = compile_properties_lexer(propSearchString, PLUGIN_SEPARATOR)
+    group_index = build_group_index(output_config["group_types"])
+    webrefs_search = re.compile(output_config["webrefs"])
+    currentProfiles = []
+    property_rows = {}
+    used_keys = set()
+    new_blocks = []
+    for block_lines in iter_file_blocks(
+            output_config["properties_input_path"]):
+        if is_profile_block(block_lines):
+            currentProfiles = get_block_profiles(block_lines, profile_spaces)
+            continue
+        block_key = get_block_key(salt, currentProfiles, block_lines)
+        used_keys.add(block_key)
+        cached_block = block_cache.execute(
+            "SELECT name, sort_name, category, row FROM blocks"
+            " WHERE key = ?", (block_key,)).fetchone()
+        if cached_block is None:
+            cached_block = render_property_block(
+                block_lines, currentProfiles, compiled, lexer, group_index,
+                webrefs_search, output_config)
+            new_blocks.append((block_key,) + cached_block)
+        prop_name, sort_name, category, row = cached_block
+        if prop_name is not None:
+            property_rows[prop_name] = (sort_name, category, row)
+    return property_rows, used_keys, new_blocks
+
+
+def writeCachedStorageFormatFile(output_config, max_cached_blocks=20000):
+    '''Render the properties table from the properties file with a cache
+    # of the rendered row of each block. Unchanged blocks are not parsed,
+    # prepared or rendered again. The output is the same as
+    # writeStorageFormatFile, but it does not write the test file'''
+    compiled = get_compiled_template("wiki_properties_template.mustache",
+                                     "propertyentries")
+    block_cache = open_block_cache(os.path.join(
+        output_config["output_subdir"],
+        output_config["properties_block_cache_file"]))
+    property_rows, used_keys, new_blocks = read_storage_format_rows(
+        block_cache, compiled, output_config)
+    save_block_cache(block_cache, new_blocks, used_keys, max_cached_blocks)
+    block_cache.close()
+    print("Rendered blocks: ", len(new_blocks))
+    # Sort like sort_for_output, then add the colours
+    sorted_rows = sorted(property_rows.items(),
+                         key=lambda x: x[1][0].lower())
+    row_colors = iter_row_colors(category
+                                 for _, (_, category, _) in sorted_rows)
+    colored_rows = {}
+    for (prop_name, (_, _, row)), prop_color in zip(sorted_rows, row_colors):
+        colored_rows[prop_name] = row.replace(ROW_COLOR_PLACEHOLDER,
+                                              prop_color)
+    with open(os.path.join(output_config["output_subdir"],
+                           output_config["properties_sf_file"]), 'w') as ef:
+        ef.write(compiled.head)
+        for _, row in iter_properties_to_document(
+                colored_rows, output_config["deprecated_to_remove"]):
+            ef.write(row)
+        ef.write(compiled.tail)
+    return True
+
+
 def writePropsToFile(propertiesToPrintDict, output_subdir,
                      wikiPropertiesFile, deprecated_to_remove,
                      FMTPRINTORDER, properties_test_file):
@@ -687,26 +1098,274 @@ def writePropsToFile(propertiesToPrintDict, output_subdir,
         headLine = "|| " + headLineText + " ||\n"
         f.write(headLine)
 
-        # 
-        for prop, propToPrint in propertiesToPrintDict.items():
-            for pluginDeprecated in deprecated_to_remove:
-                if not re.search(pluginDeprecated, prop):
-                    propLineText = " | ".join(propToPrint.values())
-                    propLine = "| " + propLineText + " |\n"
-                    f.write(propLine)
+        for prop, propToPrint in iter_properties_to_document(
+                propertiesToPrintDict, deprecated_to_remove):
+            propLineText = " | ".join(propToPrint.values())
+            propLine = "| " + propLineText + " |\n"
+            f.write(propLine)
     return True
 
 
-def main():
-    '''Process the properties file to create a wiki table'''
-    # Configure the connection to the Abiquo API
-    token = input("Enter token: ")
-    apiUrl = input("Enter API URL: ")
-    api = Abiquo(apiUrl, auth=TokenAuth(token), verify=False)
-
-    # Get the valid plugins from the API
+def escape_markdown_cell(cell_text):
+    '''Escape characters that break a Markdown table cell'''
+    cell_text = cell_text.replace("<", "&lt;").replace(">", "&gt;")
+    return cell_text.replace("|", r"\|").replace("\n", "<br/>")
+
+
+def write_wiki_output(propertiesSortedDict, output_config):
+    '''Renderer for the wiki markup table'''
+    propertiesToPrintDict = prepare_for_wiki(
+        propertiesSortedDict,
+        output_config["profile_columns"],
+        output_config["profile_images"],
+        output_config["newline"],
+        output_config["webrefs"],
+        output_config["default_profiles"],
+        output_config["plugin_blank_defaults"])
+    writePropsToFile(propertiesToPrintDict, output_config["output_subdir"],
+                     output_config["wikiPropertiesFile"],
+                     output_config["deprecated_to_remove"],
+                     output_config["FMTPRINTORDER"],
+                     output_config["properties_test_file"])
+    return output_config["wikiPropertiesFile"]
+
+
+def write_storage_format_output(propertiesSortedDict, output_config):
+    '''Renderer for the Confluence storage format table.
+    # It reads the blocks of the properties file with the block cache,
+    # so it does not use the parsed properties'''
+    writeCachedStorageFormatFile(output_config)
+    return output_config["properties_sf_file"]
+
+
+def write_markdown_output(propertiesSortedDict, output_config):
+    '''Renderer for a Markdown table, e.g. to paste in the Alt-text editor'''
+    profile_columns = output_config["profile_columns"]
+    profile_storage_format = output_config["profile_storage_format"]
+    default_profiles = output_config["default_profiles"]
+    with open(os.path.join(output_config["output_subdir"],
+                           output_config["properties_markdown_file"]),
+              'w') as mdfile:
+        mdfile.write("| Property | Description | "
+                     + " | ".join(profile_storage_format[profile]
+                                  for profile in default_profiles) + " |\n")
+        mdfile.write("|---" * (len(default_profiles) + 2) + "|\n")
+        for prop_name, propv in iter_properties_to_document(
+                propertiesSortedDict, output_config["deprecated_to_remove"]):
+            property_cell = "**" + escape_markdown_cell(propv.name) + "**"
+            for plugin, _ in propv.defaults:
+                property_cell += "<br/>- " + plugin
+            description_cell = escape_markdown_cell(propv.description)
+            if propv.validvalues is not None:
+                description_cell += "<br/>Valid values: `" \
+                    + escape_markdown_cell(propv.validvalues) + "`"
+            if propv.defaults:
+                description_cell += "<br/>Default:"
+                for plugin, default in propv.defaults:
+                    if default:
+                        description_cell += "<br/>- " + plugin + " = `" \
+                            + escape_markdown_cell(default) + "`"
+            elif propv.default:
+                description_cell += "<br/>Default: `" \
+                    + escape_markdown_cell(propv.default) + "`"
+            profile_cells = dict((profile, "") for profile in default_profiles)
+            for profile_name in propv.profiles:
+                if profile_name in profile_columns:
+                    profile_cells[profile_columns[profile_name]] = \
+                        profile_storage_format[profile_name]
+            mdfile.write("| " + property_cell + " | " + description_cell
+                         + " | " + " | ".join(profile_cells[profile]
+                                              for profile in default_profiles)
+                         + " |\n")
+    return output_config["properties_markdown_file"]
+
+
+def write_json_output(propertiesSortedDict, output_config):
+    '''Renderer for the parsed properties in JSON for other scripts'''
+    properties_json = []
+    for prop_name, propv in iter_properties_to_document(
+            propertiesSortedDict, output_config["deprecated_to_remove"]):
+        property_json = propv._asdict()
+        property_json["profiles"] = list(propv.profiles)
+        property_json["defaults"] = dict(propv.defaults)
+        properties_json.append(property_json)
+    with open(os.path.join(output_config["output_subdir"],
+                           output_config["properties_json_file"]),
+              'w') as jsonfile:
+        json.dump(properties_json, jsonfile, indent=2)
+    return output_config["properties_json_file"]
+
+
+def write_search_index_output(propertiesSortedDict, output_config):
+    '''Renderer for the index of search_properties.py'''
+    search_index = sps.build_search_index(iter_properties_to_document(
+        propertiesSortedDict, output_config["deprecated_to_remove"]))
+    sps.save_search_index(
+        os.path.join(output_config["output_subdir"],
+                     output_config["properties_search_index_file"]),
+        search_index)
+    return output_config["properties_search_index_file"]
+
+
+def write_doc_store_output(propertiesSortedDict, output_config):
+    '''Renderer for the properties of the release in the doc store'''
+    property_rows = [(propv.name, propv.category, ", ".join(propv.profiles),
+                      propv.default, json.dumps(dict(propv.defaults)),
+                      propv.description, propv.validvalues)
+                     for prop_name, propv in iter_properties_to_document(
+                         propertiesSortedDict,
+                         output_config["deprecated_to_remove"])]
+    adb.save_release_rows(output_config["release_version"],
+                          {"properties": property_rows},
+                          os.path.join(output_config["output_subdir"],
+                                       output_config["doc_store_file"]))
+    return output_config["doc_store_file"]
+
+
+# Renderers that can run on the parsed properties
+OUTPUT_RENDERERS = {"wiki": write_wiki_output,
+                    "storage": write_storage_format_output,
+                    "markdown": write_markdown_output,
+                    "json": write_json_output,
+                    "search": write_search_index_output,
+                    "store": write_doc_store_output}
+
+
+def run_output_pipeline(propertiesSortedDict, output_formats, output_config):
+    '''Send the properties from one parse to all the renderers,
+    # each in its own process'''
+    if len(output_formats) == 1:
+        return [OUTPUT_RENDERERS[output_formats[0]](propertiesSortedDict,
+                                                    output_config)]
+    with ProcessPoolExecutor(max_workers=len(output_formats)) as executor:
+        futures = [executor.submit(OUTPUT_RENDERERS[output_format],
+                                   propertiesSortedDict, output_config)
+                   for output_format in output_formats]
+        return [future.result() for future in futures]
+
+
+# Settings for the properties documentation, also used by
+# the properties benchmark, search and diff scripts
+PLUGIN_SEPARATOR = "#--"
+
+# Some profile names have spaces, which is ridiculuous but hey
+profile_spaces = {"COSTUSAGE": "COST USAGE"}
+
+# Regexes to identify properties
+propertySearchString = r"#?\s?((([\w,\-,\{,\}]{1,60}?\.){1,10})([\w,\-,\{,\}]{1,50}))(=?(.*?))\n"
+propSearchString = r"#?\s?((([\w,\-,\{,\}]{1,60}?\.){1,10})([\w,\-,\{,\}]{1,50}))(=?(.*?))"
+
+# As there is only one property, use a text file, could later change to json, etc
+process_properties_formatted = "process_properties_formatted.txt"
+
+# Improve some category names
+category_dict = {"stale": "stale sessions",
+                "dvs": "dvs and vcenter",
+                "vi": "virtual infrastructure",
+                "m": "m outbound api"}
+
+# Note that the function fix_defaults replaces some
+# default values that are set for our developers
+
+# Columns for output of properties documentation
+FMTPRINTORDER = ["Property", "Description", "API", "RS", "V2V", "OA"]
+# Confluence newline
+newline = " \\\\ "
+newline_storage_format = "<br/>"
+
+# Deprecated properties - to remove in format r"\.ha\."
+# deprecated_to_remove = [r"\.netapp\.", r"\.datastoreRdm"]
+deprecated_to_remove = [r"\.ha\."]
+list_of_dead_properties = [
+    "abiquo.esxi.datastoreRdm",
+    "abiquo.storagemanager.netapp.aggrfreespaceratio",
+    "abiquo.storagemanager.netapp.debug",
+    "abiquo.storagemanager.netapp.initiatorGroupName",
+    "abiquo.storagemanager.netapp.volumelunration",
+    "abiquo.enterprise.property.pricefactor.suffix",
+    "abiquo.enterprise.property.discount.suffix"]
+# ESXi metrics list
+metrics = ["cpu",
+           "cpu-mz",
+           "cpu-time",
+           "memory",
+           "memory-swap",
+           "memory-swap2",
+           "memory-vmmemctl",
+           "memory-physical",
+           "memory-host",
+           "disk-latency",
+           "uptime"]
+
+profile_images = {"SERVER":
+                 "{color:green}API{color}",
+                 "REMOTESERVICES":
+                 "{color:blue}RS{color}",
+                 "V2VSERVICES":
+                 "{color:grey}V2V{color}",
+                 "MOUTBOUNDAPI":
+                 "{color:brown}OA{color}",
+                 "DNSMASQ":
+                 "{color:brown}DNSMASQ{color}",
+                 "COSTUSAGE":
+                 "{color:brown}COSTUSAGE{color}",
+                 "BILLING":
+                 "{color:brown}BILLING{color}",
+                 "XAASAPI":
+                 "{color:brown}XAAS{color}",
+                 "XAASRS":
+                 "{color:brown}XAAS{color}"
+                 }
+
+# These profiles have columns in the wiki
+default_profiles = ["SERVER",
+                   "REMOTESERVICES",
+                   "V2VSERVICES"]
+
+# Piggyback other profiles into the main columns
+profile_columns = {"SERVER": "SERVER",
+                  "REMOTESERVICES": "REMOTESERVICES",
+                  "V2VSERVICES": "V2VSERVICES",
+                  "DNSMASQ": "REMOTESERVICES",
+                  "COSTUSAGE": "SERVER",
+                  "BILLING": "SERVER",
+                  "XAASAPI": "SERVER",
+                  "XAASRS": "REMOTESERVICES",
+                  "VSM" : "SERVER",
+                  "AM" : "SERVER"
+                  }
+
+
+profile_storage_format = {"SERVER": "API",
+                 "REMOTESERVICES": "RS",
+                 "V2VSERVICES": "V2V",
+                 "DNSMASQ": "DNSMASQ",
+                 "COSTUSAGE": "COSTUSAGE",
+                 "BILLING": "BILLING",
+                 "XAASAPI": "XAAS",
+                 "XAASRS": "XAAS",
+                 "VSM": "API",
+                 "AM": "API"
+                 }
+
+
+# Example websites without proper <SERVER_IP_ADDRESS> notation
+webrefs = r"abiquo\.example\.com|80\.169\.25\.32"
+
+# Properties with an empty default value to document as empty
+# Note that if this were the last property in a list, strip the
+# space from it, because otherwise it will break the italics
+# for the default values
+plugin_blank_defaults = ["hyperv_301"]
+
+# Do not remove \n and can use for other markdown formatting
+markdown_properties = ["abiquo.guest.password.length"]
+
+
+def get_group_types(plugin_catalog):
+    '''Get the plugins and metrics that make properties into groups'''
     hypervisorTypes, deviceTypes, \
-        backupPluginTypes, draasPluginTypes = get_plugins(api)
+        backupPluginTypes, draasPluginTypes = get_plugins(plugin_catalog)
     # Add "plugins" that aren't "real" plugins
     backupPluginTypes.append("veeam")
     hypervisorTypes.append("esxi")
@@ -715,182 +1374,111 @@ def main():
     plugins = hypervisorTypes + deviceTypes \
         + backupPluginTypes + draasPluginTypes
 
-    plugins.remove("e1c")
-    PLUGIN_SEPARATOR = "#--"
+    if "e1c" in plugins:
+        plugins.remove("e1c")
+    return {"{plugin}": plugins, "{metric}": metrics}
+
+
+def read_properties(input_dir, propertyFile, group_types):
+    '''Read the properties file with the settings above'''
+    return readFileGetProperties(input_dir, propertyFile,
+                                 profile_spaces,
+                                 propertySearchString,
+                                 propSearchString,
+                                 group_types,
+                                 category_dict,
+                                 newline,
+                                 markdown_properties,
+                                 PLUGIN_SEPARATOR,
+                                 list_of_dead_properties,
+                                 process_properties_formatted)
+
+
+# Option to only update the storage format table, e.g. for each commit
+STORAGE_ONLY_OPTION = "--storage-only"
+
+
+def get_output_config(output_subdir, todaysDate, input_path, group_types,
+                      release_version=""):
+    '''Get the output files and settings for the renderers'''
+    return {"output_subdir": output_subdir,
+            "properties_input_path": input_path,
+            "group_types": group_types,
+            "wikiPropertiesFile": "wiki_properties_table_" + todaysDate + ".txt",
+            "properties_sf_file": "wiki_properties_stformat_" + todaysDate + ".txt",
+            "properties_test_file": "proptestout_" + todaysDate + ".txt",
+            "properties_test_sf_file": "proptestsf_" + todaysDate + ".txt",
+            # Rendered table rows to reuse when a block has not changed
+            "properties_block_cache_file": "wiki_properties_block_cache.sqlite",
+            "properties_markdown_file": "wiki_properties_markdown_" + todaysDate + ".md",
+            "properties_json_file": "properties_" + todaysDate + ".json",
+            # Always the same file so that search_properties.py can find it
+            "properties_search_index_file": "properties_search_index.json",
+            # Release version for the doc store, e.g. v463
+            "release_version": release_version,
+            "doc_store_file": "abiquo_doc_store.sqlite",
+            "FMTPRINTORDER": FMTPRINTORDER,
+            "newline": newline,
+            "newline_storage_format": newline_storage_format,
+            "deprecated_to_remove": deprecated_to_remove,
+            "profile_images": profile_images,
+            "default_profiles": default_profiles,
+            "profile_columns": profile_columns,
+            "profile_storage_format": profile_storage_format,
+            "webrefs": webrefs,
+            "plugin_blank_defaults": plugin_blank_defaults}
 
-    # Some profile names have spaces, which is ridiculuous but hey
-    profile_spaces = {"COSTUSAGE": "COST USAGE"}
 
-    # Regexes to identify properties
-    propertySearchString = r"#?\s?((([\w,\-,\{,\}]{1,60}?\.){1,10})([\w,\-,\{,\}]{1,50}))(=?(.*?))\n"
-    propSearchString = r"#?\s?((([\w,\-,\{,\}]{1,60}?\.){1,10})([\w,\-,\{,\}]{1,50}))(=?(.*?))"
+def main():
+    '''Process the properties file to create a wiki table'''
+    if CHECK_FIXTURE_OPTION in sys.argv[1:]:
+        check_description_fixture()
+        return
+    # Record or replay the HTTP responses, see abqhttpfixtures.py
+    ahf.setup_http_fixtures()
+    # Get the valid plugins from the API or the saved plugin catalog.
+    # Work offline with the last plugin catalog if there is no API
+    plugin_catalog_file = "output_files/abiquo_plugin_catalog.json"
+    plugin_catalog_ttl = 7 * 24 * 60 * 60
+    plugin_catalog_offline = input("Use saved plugin catalog offline? (y/n): ") == "y"
+    plugin_catalog = apt.get_plugin_catalog(plugin_catalog_file,
+                                            plugin_catalog_ttl,
+                                            plugin_catalog_offline)
+    group_types = get_group_types(plugin_catalog)
 
     # Input and output files
     input_dir = '../../platform/system-properties/src/main/resources/'
     propertyFile = 'abiquo.properties'
     output_subdir = 'output_files/'
-    outputPropertyFile = 'wiki_properties_table_'
-    outputStorageFormatFile = "wiki_properties_stformat_"
-    # As there is only one property, use a text file, could later change to json, etc
-    process_properties_formatted = "process_properties_formatted.txt"
     todaysDate = datetime.today().strftime('%Y-%m-%d')
-    wikiPropertiesFile = outputPropertyFile + todaysDate + ".txt"
-    properties_sf_file = outputStorageFormatFile + todaysDate + ".txt"
-    properties_test_file = "proptestout_" + todaysDate + ".txt"
-    properties_test_sf_file = "proptestsf_" + todaysDate + ".txt"
-
-    # Improve some category names
-    category_dict = {"stale": "stale sessions",
-                    "dvs": "dvs and vcenter",
-                    "vi": "virtual infrastructure",
-                    "m": "m outbound api"}
-
-    # Note that the function fix_defaults replaces some
-    # default values that are set for our developers
-
-    # Columns for output of properties documentation
-    FMTPRINTORDER = ["Property", "Description", "API", "RS", "V2V", "OA"]
-    # Confluence newline
-    newline = " \\\\ "
-    newline_storage_format = "<br/>"
-
-    # Deprecated properties - to remove in format r"\.ha\."
-    # deprecated_to_remove = [r"\.netapp\.", r"\.datastoreRdm"]
-    deprecated_to_remove = [r"\.ha\."]
-    list_of_dead_properties = [
-        "abiquo.esxi.datastoreRdm",
-        "abiquo.storagemanager.netapp.aggrfreespaceratio",
-        "abiquo.storagemanager.netapp.debug",
-        "abiquo.storagemanager.netapp.initiatorGroupName",
-        "abiquo.storagemanager.netapp.volumelunration",
-        "abiquo.enterprise.property.pricefactor.suffix",
-        "abiquo.enterprise.property.discount.suffix"]
-    # ESXi metrics list
-    metrics = ["cpu",
-               "cpu-mz",
-               "cpu-time",
-               "memory",
-               "memory-swap",
-               "memory-swap2",
-               "memory-vmmemctl",
-               "memory-physical",
-               "memory-host",
-               "disk-latency",
-               "uptime"]
-
-    group_types = {"{plugin}": plugins, "{metric}": metrics}
-
-    profile_images = {"SERVER":
-                     "{color:green}API{color}",
-                     "REMOTESERVICES":
-                     "{color:blue}RS{color}",
-                     "V2VSERVICES":
-                     "{color:grey}V2V{color}",
-                     "MOUTBOUNDAPI":
-                     "{color:brown}OA{color}",
-                     "DNSMASQ":
-                     "{color:brown}DNSMASQ{color}",
-                     "COSTUSAGE":
-                     "{color:brown}COSTUSAGE{color}",
-                     "BILLING":
-                     "{color:brown}BILLING{color}",
-                     "XAASAPI":
-                     "{color:brown}XAAS{color}",
-                     "XAASRS":
-                     "{color:brown}XAAS{color}"
-                     }
-
-    # These profiles have columns in the wiki
-    default_profiles = ["SERVER",
-                       "REMOTESERVICES",
-                       "V2VSERVICES"]
-
-    # Piggyback other profiles into the main columns
-    profile_columns = {"SERVER": "SERVER",
-                      "REMOTESERVICES": "REMOTESERVICES",
-                      "V2VSERVICES": "V2VSERVICES",
-                      "DNSMASQ": "REMOTESERVICES",
-                      "COSTUSAGE": "SERVER",
-                      "BILLING": "SERVER",
-                      "XAASAPI": "SERVER",
-                      "XAASRS": "REMOTESERVICES",
-                      "VSM" : "SERVER",
-                      "AM" : "SERVER"
-                      }
-
-
-    profile_storage_format = {"SERVER": "API",
-                     "REMOTESERVICES": "RS",
-                     "V2VSERVICES": "V2V",
-                     "DNSMASQ": "DNSMASQ",
-                     "COSTUSAGE": "COSTUSAGE",
-                     "BILLING": "BILLING",
-                     "XAASAPI": "XAAS",
-                     "XAASRS": "XAAS",
-                     "VSM": "API",
-                     "AM": "API"
-                     }
-
-
-    # Example websites without proper <SERVER_IP_ADDRESS> notation
-    webrefs = r"abiquo\.example\.com|80\.169\.25\.32"
-
-    # Properties with an empty default value to document as empty
-    # Note that if this were the last property in a list, strip the
-    # space from it, because otherwise it will break the italics
-    # for the default values
-    plugin_blank_defaults = ["hyperv_301"]
-
-    # Do not remove \n and can use for other markdown formatting
-    markdown_properties = ["abiquo.guest.password.length"]
+    input_path = os.path.join(input_dir, propertyFile)
 
-    propertiesDict = {}
-    propertiesDict = readFileGetProperties(input_dir, propertyFile,
-                                           profile_spaces,
-                                           propertySearchString,
-                                           propSearchString,
-                                           group_types,
-                                           category_dict,
-                                           newline,
-                                           markdown_properties,
-                                           PLUGIN_SEPARATOR,
-                                           list_of_dead_properties,
-                                           process_properties_formatted)
+    if STORAGE_ONLY_OPTION in sys.argv[1:]:
+        # Only update the storage format table from the block cache
+        output_config = get_output_config(output_subdir, todaysDate,
+                                          input_path, group_types)
+        print("Wrote to file", output_subdir + write_storage_format_output(
+            None, output_config))
+        return
 
-    propertiesSortedDict = sort_for_output(propertiesDict)
+    release_version = input("Release version for the doc store, "
+                            "e.g. v463 (Enter to skip): ")
 
-    # propertiesToPrintDict = prepare_for_wiki(propertiesSortedDict,
-    #                                        profile_columns,
-    #                                        profile_images,
-    #                                        newline,
-    #                                        webrefs,
-    #                                        default_profiles,
-    #                                        plugin_blank_defaults)
-
-    properties_storage_format_dict = prepare_for_storage_format(
-                                           propertiesSortedDict,
-                                           profile_columns,
-                                           newline_storage_format,
-                                           webrefs,
-                                           default_profiles,
-                                           plugin_blank_defaults,
-                                           profile_storage_format)
-
-    # # print(json.dumps(propertiesToPrintDict, indent=4, sort_keys=True))
-    # check = writePropsToFile(propertiesToPrintDict, output_subdir,
-    #                          wikiPropertiesFile, PLGDEPRC,
-    #                          FMTPRINTORDER, properties_test_file)
-
-    # if check is True:
-    #     print("Wrote to file", output_subdir + wikiPropertiesFile)
+    propertiesDict = read_properties(input_dir, propertyFile, group_types)
 
-    check_storage_format = writeStorageFormatFile(properties_storage_format_dict, 
-                                                  output_subdir, 
-                                                  properties_sf_file, 
-                                                  deprecated_to_remove, 
-                                                  properties_test_sf_file) 
-    if check_storage_format is True:
-        print("Wrote to file", output_subdir + properties_sf_file)
+    propertiesSortedDict = sort_for_output(propertiesDict)
+
+    # Parse once and create all these formats: wiki, storage, markdown, json
+    # and the index for search_properties.py, and the doc store for a release
+    output_formats = ["storage", "wiki", "markdown", "json", "search"]
+    if release_version:
+        output_formats.append("store")
+    output_config = get_output_config(output_subdir, todaysDate, input_path,
+                                      group_types, release_version)
+
+    for output_file in run_output_pipeline(propertiesSortedDict,
+                                           output_formats, output_config):
+        print("Wrote to file", output_subdir + output_file)
 
 
 # Calls the main() function
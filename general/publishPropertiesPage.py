@@ -14,6 +14,7 @@
 
 from datetime import datetime
 import abqdoctools as adt
+import abqhttpfixtures as ahf
 
 wikiPageList = []
 inputSubdir = "output_files"
@@ -29,6 +30,8 @@ inputFile = inputSubdir + "/" + wikiInputFile
 
 
 def main():
+    # Record or replay the HTTP responses, see abqhttpfixtures.py
+    ahf.setup_http_fixtures()
     wikiContent = ""
     with open(inputFile, 'r') as f:
         wikiContent = f.read()
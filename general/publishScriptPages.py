@@ -14,6 +14,7 @@
 
 from datetime import datetime
 import abqdoctools as adt
+import abqhttpfixtures as ahf
 
 wikiPageList = []
 INPUT_SUBDIR = "output_files"
@@ -37,6 +38,8 @@ file_prefixes_pages = \
 
 def main():
     '''publish api error to cloud wiki'''
+    # Record or replay the HTTP responses, see abqhttpfixtures.py
+    ahf.setup_http_fixtures()
     # Get user credentials and space
     site_url = input("Confluence Cloud site URL, with protocol,"
                      + " and wiki, and exclude final slash, "
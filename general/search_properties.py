@@ -0,0 +1,172 @@
+#!/usr/bin/python3 -tt
+'''
+# Search the Abiquo configuration properties to find out
+# which property controls a feature, e.g. "vcenter timeout"
+#
+# The properties script saves the search index with the other formats in
+# output_files/properties_search_index.json
+# The index is an inverted index of the words in:
+# - property names, e.g. abiquo.vsm.pollfrequency
+# - descriptions
+# - plugins of property groups, e.g. vmware
+# - profiles, e.g. SERVER
+# - categories, e.g. "stale sessions"
+#
+# Run the search from the general folder, for example:
+#   python3 search_properties.py vcenter timeout
+# Or with another index file:
+#   python3 search_properties.py --index my_index.json vcenter timeout
+'''
+
+import heapq
+import json
+import math
+import re
+import sys
+import time
+
+# Increase this if the format of the index file changes
+SEARCH_INDEX_VERSION = 1
+SEARCH_INDEX_FILE = "output_files/properties_search_index.json"
+USAGE = "Usage: python3 search_properties.py [--index file] words"
+
+# A word in the name is worth more than a word in the description
+FIELD_WEIGHTS = {"name": 5,
+                 "plugin": 4,
+                 "category": 3,
+                 "profile": 2,
+                 "description": 1}
+
+# Words that are in most descriptions and don't help to find a property
+STOP_WORDS = {"a", "an", "and", "are", "as", "be", "by", "for", "if", "in",
+              "is", "it", "of", "on", "or", "that", "the", "this", "to",
+              "when", "with"}
+
+WORD_SEARCH = re.compile(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])")
+
+
+def get_words(text):
+    '''Get the search words from text. Split names on dots and dashes
+    # and camel case, e.g. "datastoreRdm" is "datastorerdm", "datastore"
+    # and "rdm"'''
+    words = []
+    for part in re.split(r"[^A-Za-z0-9]+", text):
+        if not part:
+            continue
+        word = part.lower()
+        if word not in STOP_WORDS:
+            words.append(word)
+        camel_words = WORD_SEARCH.findall(part)
+        if len(camel_words) > 1:
+            words.extend(cw.lower() for cw in camel_words
+                         if cw.lower() not in STOP_WORDS)
+    return words
+
+
+def get_property_fields(propv):
+    '''Get the text to index for each field of a property record'''
+    return {"name": [propv.name],
+            "plugin": [tag for tag, _ in propv.defaults],
+            "category": [propv.category],
+            "profile": list(propv.profiles),
+            "description": [propv.description]}
+
+
+def build_search_index(properties_to_index):
+    '''Build the inverted index from (property name, PropertyRecord) pairs.
+    # Each word has a list of [document, score] sorted by best score,
+    # where the score is the field weight times the rarity of the word'''
+    documents = []
+    word_weights = {}
+    for doc_id, (prop_name, propv) in enumerate(properties_to_index):
+        documents.append({"name": propv.name,
+                          "category": propv.category,
+                          "profiles": list(propv.profiles),
+                          "plugins": [tag for tag, _ in propv.defaults],
+                          "default": propv.default,
+                          "description": propv.description})
+        for field, texts in get_property_fields(propv).items():
+            for text in texts:
+                for word in get_words(text):
+                    doc_weights = word_weights.setdefault(word, {})
+                    doc_weights[doc_id] = doc_weights.get(doc_id, 0) \
+                        + FIELD_WEIGHTS[field]
+
+    postings = {}
+    for word, doc_weights in word_weights.items():
+        rarity = math.log(1 + len(documents) / len(doc_weights))
+        postings[word] = sorted(([doc_id, round(weight * rarity, 4)]
+                                 for doc_id, weight in doc_weights.items()),
+                                key=lambda posting: -posting[1])
+    return {"version": SEARCH_INDEX_VERSION,
+            "documents": documents,
+            "postings": postings}
+
+
+def save_search_index(index_path, search_index):
+    '''Save the search index with the properties build'''
+    with open(index_path, "w") as index_file:
+        json.dump(search_index, index_file)
+
+
+def load_search_index(index_path):
+    '''Load the search index or exit if it is from an old version'''
+    with open(index_path, "r") as index_file:
+        search_index = json.load(index_file)
+    if search_index.get("version") != SEARCH_INDEX_VERSION:
+        print("Run process_properties_table.py to update the search index: ",
+              index_path)
+        sys.exit()
+    return search_index
+
+
+def search_properties(search_index, query, max_results=10):
+    '''Get the best properties for the query as (score, document) pairs.
+    # Properties that match more words of the query come first'''
+    scores = {}
+    matches = {}
+    for word in set(get_words(query)):
+        for doc_id, score in search_index["postings"].get(word, ()):
+            scores[doc_id] = scores.get(doc_id, 0) + score
+            matches[doc_id] = matches.get(doc_id, 0) + 1
+    best = heapq.nsmallest(max_results, scores,
+                           key=lambda doc_id: (-matches[doc_id],
+                                               -scores[doc_id]))
+    return [(round(scores[doc_id], 2), search_index["documents"][doc_id])
+            for doc_id in best]
+
+
+def print_result(score, document):
+    '''Print a property that matches the query'''
+    print("%8.2f  %s" % (score, document["name"]))
+    print("          Category: ", document["category"],
+          " Profiles: ", ", ".join(document["profiles"]))
+    if document["plugins"]:
+        print("          Plugins: ", ", ".join(document["plugins"]))
+    elif document["default"]:
+        print("          Default: ", document["default"])
+    print("          " + document["description"][:160])
+
+
+def main():
+    '''Search the properties for the words on the command line'''
+    args = sys.argv[1:]
+    index_path = SEARCH_INDEX_FILE
+    if args[:1] == ["--index"] and len(args) > 1:
+        index_path = args[1]
+        args = args[2:]
+    if not args or args[:1] == ["--index"]:
+        print(USAGE)
+        sys.exit()
+    search_index = load_search_index(index_path)
+    start = time.perf_counter()
+    results = search_properties(search_index, " ".join(args))
+    query_ms = (time.perf_counter() - start) * 1000
+    for score, document in results:
+        print_result(score, document)
+    print("Found %d properties in %.3f ms" % (len(results), query_ms))
+
+
+# Calls the main() function
+if __name__ == '__main__':
+    main()